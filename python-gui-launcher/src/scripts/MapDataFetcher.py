@@ -1,61 +1,253 @@
 import os
+import csv
 import stat
 import json
 import re
 import math
-import tempfile
+import struct
+import gzip
+import time
+import hashlib
+import sqlite3
+import threading
+from array import array
+from xml.etree import ElementTree
 from pathlib import Path
 from typing import List, Tuple
 import shutil
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from contextlib import closing
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
 import geopandas as gpd
+import pyogrio
+import pyarrow.parquet as pq
 import folium
+import matplotlib
+from matplotlib import colors as mcolors, image as mimage
 import pandas as pd
 import numpy as np
-from shapely.geometry import Polygon, Point, shape
+from shapely.geometry import Polygon, Point, shape, box
 from shapely.geometry.polygon import orient
+import shapely
+from shapely import wkt
 import mercantile
 import cadquery as cq
 from tqdm import tqdm
-from OSMPythonTools.overpass import Overpass
+import requests
+import urllib3
 from pyproj import Transformer
 import pyvista as pv
 
 
-class OSMDataFetcherCircle:
-    def __init__(self, dms_lat, dms_lon, radius_meters=1500, cache_dir="cache"):
-        """Initializes the OSMDataFetcher with provided latitude, longitude, and radius."""
-        self.overpass = Overpass()
-        # Parse DMS coordinates to decimal degrees
-        self.latitude = self.parse_dms(dms_lat)
-        self.longitude = self.parse_dms(dms_lon)
-        self.center = Point(self.longitude, self.latitude)
-        self.radius_meters = radius_meters
-        self.cache_dir = Path(cache_dir).absolute()
+class OverpassCache:
+    def __init__(self, cache_dir="cache", ttl_seconds=7 * 24 * 3600, max_size_bytes=512 * 1024 ** 2):
+        """
+        Persistent, content-addressed cache of Overpass responses.
 
-        # Create AOI (Area of Interest) Polygon
-        self.aoi_polygon = self.create_circle(self.center, self.radius_meters)
+        Entries are compressed NumPy archives of parsed responses, named by a hash of the normalized
+        query. Entries older than ttl_seconds are ignored and removed, and the least recently used
+        entries are evicted once the cache grows past max_size_bytes.
+        """
+        self.cache_dir = Path(cache_dir) / "overpass"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+
+    def make_key(self, feature_types, geometry):
+        """Hash the sorted feature types and the normalized, rounded query geometry."""
+        payload = json.dumps({
+            "feature_types": sorted(set(feature_types)),
+            "geometry": wkt.dumps(geometry.normalize(), rounding_precision=7),
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.npz"
+
+    def get(self, key):
+        """Return the cached response arrays for a key, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            modified = path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        if time.time() - modified > self.ttl_seconds:
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            with np.load(path) as archive:
+                result = {name: archive[name] for name in archive.files}
+        except (OSError, ValueError):
+            path.unlink(missing_ok=True)  # Drop corrupt or partially written entries
+            return None
+        # Access time drives LRU eviction, modification time keeps tracking the entry's age
+        os.utime(path, (time.time(), modified))
+        return result
+
+    def set(self, key, result):
+        """Store the response arrays for a key and evict old entries if the cache is over its size cap."""
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **result)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """Remove expired entries, then least recently used ones until under max_size_bytes."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for path in self.cache_dir.glob("*.npz"):
+                try:
+                    info = path.stat()
+                except FileNotFoundError:
+                    continue
+                if now - info.st_mtime > self.ttl_seconds:
+                    path.unlink(missing_ok=True)
+                else:
+                    entries.append((info.st_atime, info.st_size, path))
 
-        # Create a rectangle around the center point
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_size_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total_size -= size
 
-        # Feature types to fetch (building, amenity, natural)
-        self.feature_types = ["building", "amenity", "natural"]
 
-        # Clear the cache directory if it exists
-        if self.cache_dir.exists():
-            try:
-                # Delete only contents, keep the directory
-                for item in self.cache_dir.iterdir():
-                    if item.is_file():
-                        item.unlink()  # Remove files
-                    elif item.is_dir():
-                        shutil.rmtree(item)  # Remove subdirectories
-                print("Cleared existing cache directory")
-            except (PermissionError, OSError) as e:
-                print(f"Warning: Could not clear cache directory: {e}")
+class GeoFileIO:
+    """Read and write the files handed between pipeline stages, choosing the format by file suffix."""
+
+    # GeoParquet is the default between stages, FlatGeobuf and GeoJSON are kept for interchange
+    SUFFIXES = {"parquet": ".parquet", "flatgeobuf": ".fgb", "geojson": ".geojson"}
+    ROW_GROUP_SIZE = 20000
+
+    @classmethod
+    def suffix(cls, file_format):
+        """File suffix for a format name."""
+        if file_format not in cls.SUFFIXES:
+            raise ValueError(f"Unknown file format '{file_format}', expected one of {tuple(cls.SUFFIXES)}")
+        return cls.SUFFIXES[file_format]
+
+    @classmethod
+    def write(cls, gdf, path, mode="w"):
+        """
+        Write a GeoDataFrame to path.
+
+        GeoParquet rows are sorted along a Hilbert curve and written with bbox covering columns,
+        FlatGeobuf gets a packed R-tree, so later bbox reads only touch the rows they need.
+        """
+        path = Path(path)
+        if path.suffix == ".parquet":
+            if mode != "w":
+                raise ValueError("GeoParquet files cannot be appended to, write them in one go")
+            if len(gdf):
+                gdf = gdf.iloc[np.argsort(gdf.geometry.hilbert_distance(), kind="stable")]
+            gdf.to_parquet(path, index=False, write_covering_bbox=True, row_group_size=cls.ROW_GROUP_SIZE)
+        elif path.suffix == ".fgb":
+            gdf.to_file(path, driver="FlatGeobuf", SPATIAL_INDEX="YES", mode=mode)
         else:
-            # Create cache directory if it doesn't exist
-            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            gdf.to_file(path, driver="GeoJSON", COORDINATE_PRECISION=7, mode=mode)
+
+    @staticmethod
+    def read(path, bbox=None):
+        """Read a file, optionally only the features intersecting a (minx, miny, maxx, maxy) bbox."""
+        if Path(path).suffix == ".parquet":
+            return gpd.read_parquet(path, bbox=bbox)
+        return gpd.read_file(path, bbox=bbox)
+
+    @staticmethod
+    def bounds(path):
+        """Feature bounds as a (4, n) array, read from the bbox columns or the spatial index only."""
+        if Path(path).suffix == ".parquet":
+            bbox = pq.read_table(path, columns=["bbox"]).column("bbox").combine_chunks()
+            return np.stack([bbox.field(name).to_numpy(zero_copy_only=False) for name in ("xmin", "ymin", "xmax", "ymax")])
+        return pyogrio.read_bounds(path)[1]
+
+
+class BackgroundWriter:
+    def __init__(self, max_workers=1):
+        """
+        Persist stage results on a background thread while the next stage keeps working.
+
+        Files are written under a temporary name and renamed when complete, so a reader never
+        sees a half-written file. wait() blocks until everything submitted so far is on disk.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = []
+
+    def submit(self, gdf, path):
+        """Queue a GeoDataFrame to be written to path and return the path right away."""
+        path = Path(path)
+        self.futures.append(self.executor.submit(self._write, gdf, path))
+        return path
+
+    @staticmethod
+    def _write(gdf, path):
+        tmp_path = path.with_name(f"{path.stem}.{threading.get_ident()}.tmp{path.suffix}")
+        GeoFileIO.write(gdf, tmp_path)
+        os.replace(tmp_path, path)
+        print(f"Saved: {path}")
+
+    def wait(self):
+        """Block until all queued writes are done, re-raising the first write error."""
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """Wait for the queued writes and stop the writer thread."""
+        self.wait()
+        self.executor.shutdown()
+
+
+class OverpassQueryTooLarge(RuntimeError):
+    """Overpass aborted a query because it ran into its time or memory limit."""
+
+
+class OSMDataFetcher:
+    """Base class with the Overpass query logic shared by the circle and GeoJSON AOI fetchers."""
+
+    # Rough number of features per km² for each feature type, used to size the query tiles
+    FEATURE_DENSITY = {"building": 2500, "amenity": 400, "natural": 150}
+    DEFAULT_FEATURE_DENSITY = 500
+
+    OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+    # Quadtree tiling limits and per-tile Overpass timeout in seconds. In "poly" mode the depth is
+    # counted from the AOI bounding box, in "bbox" and "around" mode from the global lon/lat grid.
+    MAX_FEATURES_PER_TILE = 4000
+    MAX_TILE_DEPTH = 6
+    MAX_GRID_LEVEL = 20
+    QUERY_TIMEOUT = 120
+    # A tile whose query is too large is split at most this many levels below its starting level
+    MAX_RETRY_SPLITS = 2
+
+    # Rate-limited queries (HTTP 429/503/504) are retried after a pause instead of being split. The
+    # pause doubles per attempt from RETRY_BACKOFF seconds unless the server sends Retry-After.
+    # MAX_TILE_RETRIES bounds the retries of one tile, RETRIES_PER_TILE times the number of tiles
+    # bounds the retries and splits of one fetch together as a failsafe.
+    RETRY_STATUSES = (429, 503, 504)
+    RETRY_BACKOFF = 2.0
+    MAX_RETRY_DELAY = 300
+    MAX_TILE_RETRIES = 8
+    RETRIES_PER_TILE = 3
+    # Queries the public Overpass instance runs at once per IP, the default number of workers
+    OVERPASS_SLOTS = 2
+
+    # Metre/feet length parsing of tag values
+    NUMBER_PATTERN = r"^\s*(\d+(?:\.\d+)?)"
+    FEET_PATTERN = r"(?:ft|feet|')\s*$"
+    # building:levels values above this are tagging errors and become NA
+    MAX_LEVELS = 500
+
+    # "poly" sends the AOI ring to Overpass, "bbox" queries grid-aligned tile bounding boxes and
+    # clips locally, "around" does the same with an additional radius filter for circular AOIs
+    QUERY_MODES = ("poly", "bbox", "around")
 
     def dms_to_decimal(self, degrees, minutes, seconds, direction):
         """Convert DMS (Degrees, Minutes, Seconds) to Decimal Degrees."""
@@ -69,72 +261,438 @@ class OSMDataFetcherCircle:
             raise ValueError("Invalid DMS format")
         return self.dms_to_decimal(*map(float, match.groups()[:-1]), match.group(4))
 
-    def create_circle(self, center, radius, num_points=64):
-        """Create a circular polygon from a center point and radius."""
-        earth_radius = 6378137  # Earth's radius in meters
-        lat, lon = center.y, center.x
-        angles = [2 * math.pi * i / num_points for i in range(num_points)]
-        circle_points = [
-            (
-                lon + (radius * math.cos(angle) / (earth_radius * math.cos(math.radians(lat)))) * (180 / math.pi),
-                lat + (radius * math.sin(angle) / earth_radius) * (180 / math.pi)
-            )
-            for angle in angles
+    def _area_km2(self, geometry):
+        """Approximate area of a lon/lat geometry in km² using an equirectangular projection."""
+        lat = geometry.centroid.y
+        return geometry.area * 111.32 * 110.574 * math.cos(math.radians(lat))
+
+    def _split_tile(self, tile):
+        """Split a rectangular tile into its four quadtree children."""
+        west, south, east, north = tile.bounds
+        mid_lon, mid_lat = (west + east) / 2, (south + north) / 2
+        return [
+            box(west, south, mid_lon, mid_lat),
+            box(mid_lon, south, east, mid_lat),
+            box(west, mid_lat, mid_lon, north),
+            box(mid_lon, mid_lat, east, north),
         ]
-        circle_points.append(circle_points[0])
-        return Polygon(circle_points)
 
-    def get_osm_data(self, feature_type):
-        """Fetch OSM data for a given feature type."""
-        poly_coords = " ".join(f"{lat} {lon}" for lon, lat in self.aoi_polygon.exterior.coords)
-        query = f'(way["{feature_type}"](poly:"{poly_coords}");); (._;>;); out body;'
-        response = self.overpass.query(query, timeout=120)
-        elements = response.toJSON().get("elements", [])
-        
-        if not elements:
-            print(f"No {feature_type} data found in the area.")
-            return None
+    def _max_depth(self):
+        """Deepest quadtree level tiles may be split to for the current query mode."""
+        return self.MAX_TILE_DEPTH if self.query_mode == "poly" else self.MAX_GRID_LEVEL
+
+    def split_aoi_into_tiles(self, feature_types):
+        """Split the AOI into quadtree tiles sized so each holds about MAX_FEATURES_PER_TILE features."""
+        if self.query_mode not in self.QUERY_MODES:
+            raise ValueError(f"Unknown query mode '{self.query_mode}', expected one of {self.QUERY_MODES}")
+        if self.query_mode == "around" and not hasattr(self, "radius_meters"):
+            raise ValueError("The 'around' query mode is only available for circular AOIs.")
+
+        density = sum(self.FEATURE_DENSITY.get(feature_type, self.DEFAULT_FEATURE_DENSITY) for feature_type in feature_types)
+        if self.query_mode == "poly":
+            root = box(*self.aoi_polygon.bounds)
+        else:
+            # Tiles of a global grid line up between overlapping AOIs, so their cached responses are shared
+            root = box(-180, -90, 180, 90)
+
+        tiles = []
+        stack = [(root, 0)]
+        while stack:
+            tile, depth = stack.pop()
+            part = tile.intersection(self.aoi_polygon)
+            if part.is_empty:
+                continue
+            # Bbox queries return everything in the tile, not just the part inside the AOI
+            queried = part if self.query_mode == "poly" else tile
+            if self._area_km2(queried) * density <= self.MAX_FEATURES_PER_TILE or depth >= self._max_depth():
+                tiles.append((tile, depth))
+            else:
+                stack.extend((child, depth + 1) for child in self._split_tile(tile))
+        return tiles
+
+    def _empty_result(self):
+        """Parsed response arrays for a tile without any elements."""
+        return {
+            "node_ids": np.empty(0, dtype=np.int64),
+            "node_coords": np.empty((0, 2), dtype=np.float64),
+            "way_ids": np.empty(0, dtype=np.int64),
+            "way_offsets": np.zeros(1, dtype=np.int64),
+            "way_refs": np.empty(0, dtype=np.int64),
+            "way_tags": np.array("[]"),
+        }
+
+    def _parse_overpass_xml(self, stream):
+        """
+        Stream-parse an Overpass XML response into flat NumPy arrays.
+
+        Nodes become an id array and an (n, 2) lon/lat array. Way node references are stored
+        flat in way_refs, with way i spanning way_refs[way_offsets[i]:way_offsets[i + 1]], and
+        the way tags are kept as one JSON string. Parsed elements are released as soon as they
+        are read, so memory stays close to the size of the arrays.
+        """
+        node_ids, node_coords = array("q"), array("d")
+        way_ids, way_refs, way_offsets = array("q"), array("q"), array("q", [0])
+        way_tags = []
+        tags = {}
+        root = None
+        for event, elem in ElementTree.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == "nd":
+                way_refs.append(int(elem.get("ref")))
+            elif elem.tag == "tag":
+                tags[elem.get("k")] = elem.get("v")
+            elif elem.tag == "node":
+                node_ids.append(int(elem.get("id")))
+                node_coords.extend((float(elem.get("lon")), float(elem.get("lat"))))
+                tags = {}
+                root.clear()
+            elif elem.tag == "way":
+                way_ids.append(int(elem.get("id")))
+                way_offsets.append(len(way_refs))
+                way_tags.append(tags)
+                tags = {}
+                root.clear()
+            elif elem.tag == "relation":
+                tags = {}
+                root.clear()
+            elif elem.tag == "remark" and "error" in (elem.text or ""):
+                # Overpass reports timeouts and out-of-memory aborts as a remark in a 200 response
+                message = elem.text.strip()
+                if re.search(r"timed out|out of memory", message, re.IGNORECASE):
+                    raise OverpassQueryTooLarge(f"Overpass error: {message}")
+                raise RuntimeError(f"Overpass error: {message}")
+
+        return {
+            "node_ids": np.asarray(node_ids, dtype=np.int64),
+            "node_coords": np.asarray(node_coords, dtype=np.float64).reshape(-1, 2),
+            "way_ids": np.asarray(way_ids, dtype=np.int64),
+            "way_offsets": np.asarray(way_offsets, dtype=np.int64),
+            "way_refs": np.asarray(way_refs, dtype=np.int64),
+            "way_tags": np.array(json.dumps(way_tags)),
+        }
+
+    def _query_tile(self, feature_types, tile):
+        """Run one Overpass union query for all feature types in one tile of the AOI."""
+        part = tile.intersection(self.aoi_polygon)
+        filters = []
+        if self.query_mode == "poly":
+            polygons = [g for g in getattr(part, "geoms", [part]) if isinstance(g, Polygon)]
+            for polygon in polygons:
+                poly_coords = " ".join(f"{lat} {lon}" for lon, lat in polygon.exterior.coords)
+                filters.extend(f'way["{feature_type}"](poly:"{poly_coords}");' for feature_type in feature_types)
         else:
-            node_coords = {e["id"]: (e["lon"], e["lat"]) for e in elements if e["type"] in ["node"]}
+            west, south, east, north = tile.bounds
+            area_filter = f"({south},{west},{north},{east})"
+            if self.query_mode == "around":
+                area_filter += f"(around:{self.radius_meters},{self.latitude},{self.longitude})"
+            else:
+                # The response covers the whole tile, so it is cached under the tile rather than the AOI part
+                part = tile
+            filters.extend(f'way["{feature_type}"]{area_filter};' for feature_type in feature_types)
+        if not filters:
+            return self._empty_result()
+
+        key = self.response_cache.make_key(feature_types, part)
+        result = self.response_cache.get(key)
+        if result is None:
+            query = f'[out:xml][timeout:{self.QUERY_TIMEOUT}];({"".join(filters)}); (._;>;); out body;'
+            response = requests.post(self.OVERPASS_URL, data={"data": query}, stream=True, timeout=self.QUERY_TIMEOUT + 30)
+            with response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                result = self._parse_overpass_xml(response.raw)
+            self.response_cache.set(key, result)
+        return result
+
+    def _query_tile_after(self, delay, feature_types, tile):
+        """Wait delay seconds, then query the tile. Used to retry rate-limited queries."""
+        time.sleep(delay)
+        return self._query_tile(feature_types, tile)
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying a rate-limited query, taken from Retry-After when present."""
+        retry_after = error.response.headers.get("Retry-After", "").strip()
+        delay = self.RETRY_BACKOFF * 2 ** attempt
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    pass
+        return min(max(delay, 0.0), self.MAX_RETRY_DELAY)
+
+    def _ragged_gather(self, starts, lengths):
+        """Flat indices that concatenate the slices [start, start + length) of a ragged array."""
+        out_offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        return np.repeat(starts - out_offsets, lengths) + np.arange(int(lengths.sum()))
+
+    def _merge_tile_results(self, results):
+        """
+        Merge parsed tile responses into one set of arrays.
 
-            features = []
-            for element in elements:
-                if element.get("type") == "way" or "nodes" in element:
+        Nodes are deduplicated and sorted by id in one pass, so way references can be resolved
+        with searchsorted. Ways crossing tile borders are returned by every tile they touch,
+        only the first copy of each way id is kept.
+        """
+        if not results:
+            return self._empty_result()
+
+        node_ids, first_node = np.unique(np.concatenate([r["node_ids"] for r in results]), return_index=True)
+        node_coords = np.concatenate([r["node_coords"] for r in results])[first_node]
+
+        starts, lengths, way_tags = [], [], []
+        ref_base = 0
+        for r in results:
+            offsets = r["way_offsets"]
+            starts.append(offsets[:-1] + ref_base)
+            lengths.append(np.diff(offsets))
+            way_tags.extend(json.loads(str(r["way_tags"])))
+            ref_base += len(r["way_refs"])
+        all_refs = np.concatenate([r["way_refs"] for r in results])
+        starts, lengths = np.concatenate(starts), np.concatenate(lengths)
+
+        way_ids, first_way = np.unique(np.concatenate([r["way_ids"] for r in results]), return_index=True)
+        lengths = lengths[first_way]
+        way_offsets = np.zeros(len(way_ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=way_offsets[1:])
+        gather = self._ragged_gather(starts[first_way], lengths)
+
+        return {
+            "node_ids": node_ids,
+            "node_coords": node_coords,
+            "way_ids": way_ids,
+            "way_offsets": way_offsets,
+            "way_refs": all_refs[gather],
+            "way_tags": [way_tags[i] for i in first_way],
+        }
+
+    def _fetch_tiles(self, feature_types):
+        """
+        Fetch all AOI tiles concurrently.
+
+        Rate-limited queries are retried with backoff. A tile whose query hits the Overpass time or
+        memory limit is split into smaller ones. Any other error is raised.
+        """
+        tiles = self.split_aoi_into_tiles(feature_types)
+        results = []
+        retries = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                tqdm(total=len(tiles), desc=f"Fetching OSM {', '.join(feature_types)} tiles") as progress:
+            pending = {executor.submit(self._query_tile, feature_types, tile): (tile, 0, 0) for tile, _ in tiles}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tile, splits, attempt = pending.pop(future)
                     try:
-                        coords = [node_coords[node_id] for node_id in element["nodes"]]
-                        # Create a Polygon geometry for the building (or other feature)
-                        features.append({"geometry": Polygon(coords), "tags": element.get("tags", {})})
-                    except KeyError:
-                        continue  # Skip incomplete data
-
-            # Explicitly create a GeoDataFrame with the 'geometry' column
-            gdf = gpd.GeoDataFrame(features, geometry="geometry", crs="EPSG:4326")
-            return gdf
+                        results.append(future.result())
+                    except requests.HTTPError as e:
+                        if e.response is None or e.response.status_code not in self.RETRY_STATUSES or attempt >= self.MAX_TILE_RETRIES \
+                                or retries >= self.RETRIES_PER_TILE * progress.total:
+                            raise
+                        retries += 1
+                        delay = self._retry_delay(e, attempt)
+                        print(f"Overpass is busy (HTTP {e.response.status_code}), retrying tile in {delay:.0f} s")
+                        pending[executor.submit(self._query_tile_after, delay, feature_types, tile)] = (tile, splits, attempt + 1)
+                        continue
+                    except (OverpassQueryTooLarge, requests.ReadTimeout, urllib3.exceptions.ReadTimeoutError) as e:
+                        if splits >= self.MAX_RETRY_SPLITS or retries >= self.RETRIES_PER_TILE * progress.total:
+                            raise
+                        retries += 1
+                        print(f"Tile query failed ({e}), retrying as smaller tiles")
+                        children = [child for child in self._split_tile(tile) if child.intersects(self.aoi_polygon)]
+                        progress.total += len(children)
+                        for child in children:
+                            pending[executor.submit(self._query_tile, feature_types, child)] = (child, splits + 1, 0)
+                    progress.update(1)
+        return self._merge_tile_results(results)
+
+    def build_polygons(self, coords, offsets):
+        """
+        Build polygons in bulk from ragged ring coordinates.
 
-    def fetch_osm_data(self):
-        """Fetch OSM data for all feature types (building, amenity, natural)."""
-        datasets = {feature: self.get_osm_data(feature) for feature in self.feature_types}
+        Ring i is coords[offsets[i]:offsets[i + 1]]. Rings are closed where needed, rings with
+        fewer than three distinct vertices are dropped, and invalid polygons are repaired with
+        make_valid, keeping their largest polygonal part. Returns the polygon array and the
+        indices of the input rings it was built from.
+        """
+        lengths = np.diff(offsets)
+        if len(lengths) == 0:
+            return np.empty(0, dtype=object), np.empty(0, dtype=np.int64)
+
+        # A ring is closed when its last vertex repeats the first one
+        first, last = offsets[:-1], offsets[1:] - 1
+        nonempty = lengths > 0
+        closed = np.zeros(len(lengths), dtype=bool)
+        closed[nonempty] = (coords[first[nonempty]] == coords[last[nonempty]]).all(axis=1)
+        kept = np.flatnonzero(lengths - closed >= 3)
+
+        ring_index = np.repeat(np.arange(len(kept)), lengths[kept])
+        gather = self._ragged_gather(offsets[:-1][kept], lengths[kept])
+        # linearrings closes open rings itself
+        polygons = shapely.polygons(shapely.linearrings(coords[gather], indices=ring_index))
+
+        invalid = np.flatnonzero(~shapely.is_valid(polygons))
+        if invalid.size:
+            parts, part_index = shapely.get_parts(shapely.make_valid(polygons[invalid]), return_index=True)
+            is_polygon = shapely.get_type_id(parts) == 3
+            parts, part_index = parts[is_polygon], part_index[is_polygon]
+            # Largest part per repaired polygon: sort by (index, area) and take the last of each run
+            order = np.lexsort((shapely.area(parts), part_index))
+            last_of_run = np.r_[part_index[order][1:] != part_index[order][:-1], True]
+            best = order[last_of_run]
+            repaired = np.full(invalid.size, None, dtype=object)
+            repaired[part_index[best]] = parts[best]
+            polygons[invalid] = repaired
+
+        nonempty = ~shapely.is_missing(polygons) & (shapely.area(polygons) > 0)
+        return polygons[nonempty], kept[nonempty]
+
+    def get_osm_layers(self, feature_types):
+        """Fetch several feature types in one round trip and split them into one GeoDataFrame per type."""
+        osm = self._fetch_tiles(feature_types)
+        node_ids, way_refs, way_offsets = osm["node_ids"], osm["way_refs"], osm["way_offsets"]
+
+        # Resolve every way node reference against the sorted node ids at once
+        positions = np.searchsorted(node_ids, way_refs).clip(max=max(len(node_ids) - 1, 0))
+        found = node_ids[positions] == way_refs if len(node_ids) else np.zeros(len(way_refs), dtype=bool)
+        way_index = np.repeat(np.arange(len(osm["way_ids"])), np.diff(way_offsets))
+        complete = np.bincount(way_index[~found], minlength=len(osm["way_ids"])) == 0
+        coords = osm["node_coords"][positions] if len(node_ids) else np.empty((0, 2))
+
+        in_layer = np.array([any(feature_type in tags for feature_type in feature_types) for tags in osm["way_tags"]], dtype=bool)
+        selected = np.flatnonzero(complete & in_layer)  # Skip incomplete data and untagged child ways
+
+        # Create Polygon geometries for all buildings (or other features) in one call
+        lengths = np.diff(way_offsets)[selected]
+        gather = self._ragged_gather(way_offsets[:-1][selected], lengths)
+        polygons, kept = self.build_polygons(coords[gather], np.concatenate(([0], np.cumsum(lengths))))
+        selected = selected[kept]
+
+        if self.query_mode != "poly":
+            # Tiles were queried by bounding box, keep only the features touching the AOI itself
+            shapely.prepare(self.aoi_polygon)
+            inside = shapely.intersects(self.aoi_polygon, polygons)
+            polygons, selected = polygons[inside], selected[inside]
+        way_ids = osm["way_ids"][selected]
+        way_tags = [osm["way_tags"][i] for i in selected]
+
+        datasets = {}
+        for feature_type in feature_types:
+            mask = np.array([feature_type in tags for tags in way_tags], dtype=bool)
+            if not mask.any():
+                print(f"No {feature_type} data found in the area.")
+                datasets[feature_type] = None
+            else:
+                # Explicitly create a GeoDataFrame with the 'geometry' column
+                columns = self.typed_columns([tags for tags, keep in zip(way_tags, mask) if keep], feature_type)
+                datasets[feature_type] = gpd.GeoDataFrame(
+                    {"osm_id": way_ids[mask], **columns},
+                    geometry=polygons[mask], crs="EPSG:4326"
+                )
+        return datasets
+
+    @classmethod
+    def parse_measure(cls, values):
+        """Parse OSM length strings such as "12", "12.5 m" or "40 ft" into metres, NaN when unparsable."""
+        values = pd.Series(values, dtype=object).astype("string")
+        metres = pd.to_numeric(values.str.extract(cls.NUMBER_PATTERN, expand=False), errors="coerce")
+        feet = values.str.contains(cls.FEET_PATTERN, regex=True).fillna(False).to_numpy(dtype=bool)
+        return np.where(feet, metres * 0.3048, metres).astype(np.float64)
+
+    def typed_columns(self, way_tags, feature_type):
+        """Normalize the tag dicts of one layer into typed height, levels and category columns."""
+        # Tags kept as typed columns, everything else is dropped at ingest
+        height = self.parse_measure([tags.get("height") for tags in way_tags])
+        levels = self.parse_measure([tags.get("building:levels") for tags in way_tags])
+        return {
+            "height": np.where(height > 0, height, np.nan),
+            "levels": pd.array(np.where((levels > 0) & (levels <= self.MAX_LEVELS), np.floor(levels), np.nan), dtype="Int16"),
+            feature_type: pd.Categorical([tags.get(feature_type) for tags in way_tags]),
+        }
 
-        if datasets is None:
+    def get_osm_data(self, feature_type):
+        """Fetch OSM data for a given feature type."""
+        return self.get_osm_layers([feature_type])[feature_type]
+
+    def fetch_osm_data(self, persist=True, writer=None):
+        """
+        Fetch OSM data for all feature types (building, amenity, natural) in a single query.
+
+        The building layer is saved unless persist is False, in the background if a BackgroundWriter is given.
+        """
+        datasets = self.get_osm_layers(self.feature_types)
+
+        if all(data is None for data in datasets.values()):
             print("No data found for the given feature types.")
             return None
         else:
-            # Save Data as GeoJSON
+            # Save building data for the next stage, amenity and natural layers are only kept in memory
             for feature, data in datasets.items():
-                if feature in ["amenity", "natural"]:
-                    return None
+                if feature in ["amenity", "natural"] or data is None or not persist:
+                    continue
+                filename = self.cache_dir / f"osm_{feature}{self.file_suffix}"
+                if writer is not None:
+                    writer.submit(data, filename)
                 else:
-                    filename = self.cache_dir / f"osm_{feature}.geojson"
-                    data.to_file(filename, driver="GeoJSON")
+                    GeoFileIO.write(data, filename)
                     print(f"Saved: {filename}")
+                self.output_paths[feature] = filename
 
             return datasets
 
 
-class OSMDataFetcherGeoJSON:
-    def __init__(self, geojson_path, cache_dir="cache"):
+class OSMDataFetcherCircle(OSMDataFetcher):
+    def __init__(self, dms_lat, dms_lon, radius_meters=1500, cache_dir="cache", max_workers=None, query_mode="bbox", file_format="parquet"):
         """Initializes the OSMDataFetcher with provided latitude, longitude, and radius."""
-        self.overpass = Overpass()
+        self.max_workers = max_workers or self.OVERPASS_SLOTS
+        self.query_mode = query_mode
+        # Parse DMS coordinates to decimal degrees
+        self.latitude = self.parse_dms(dms_lat)
+        self.longitude = self.parse_dms(dms_lon)
+        self.center = Point(self.longitude, self.latitude)
+        self.radius_meters = radius_meters
+        self.cache_dir = Path(cache_dir).absolute()
+
+        # Create AOI (Area of Interest) Polygon
+        self.aoi_polygon = self.create_circle(self.center, self.radius_meters)
+
+        # Create a rectangle around the center point
+
+        # Feature types to fetch (building, amenity, natural)
+        self.feature_types = ["building", "amenity", "natural"]
+
+        # Create cache directory if it doesn't exist, earlier results are kept and reused
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.response_cache = OverpassCache(self.cache_dir)
+        self.file_suffix = GeoFileIO.suffix(file_format)
+        self.output_paths = {}
+
+    def create_circle(self, center, radius, num_points=64):
+        """Create a circular polygon from a center point and radius."""
+        earth_radius = 6378137  # Earth's radius in meters
+        lat, lon = center.y, center.x
+        angles = [2 * math.pi * i / num_points for i in range(num_points)]
+        circle_points = [
+            (
+                lon + (radius * math.cos(angle) / (earth_radius * math.cos(math.radians(lat)))) * (180 / math.pi),
+                lat + (radius * math.sin(angle) / earth_radius) * (180 / math.pi)
+            )
+            for angle in angles
+        ]
+        circle_points.append(circle_points[0])
+        return Polygon(circle_points)
+
+
+class OSMDataFetcherGeoJSON(OSMDataFetcher):
+    def __init__(self, geojson_path, cache_dir="cache", max_workers=None, query_mode="bbox", file_format="parquet"):
+        """Initializes the OSMDataFetcher with provided latitude, longitude, and radius."""
+        self.max_workers = max_workers or self.OVERPASS_SLOTS
+        self.query_mode = query_mode
         with open(geojson_path, 'r') as file:
             data = json.load(file)
         
@@ -155,95 +713,265 @@ class OSMDataFetcherGeoJSON:
         # Feature types to fetch (building, amenity, natural)
         self.feature_types = ["building", "amenity", "natural"]
 
-        # Clear the cache directory if it exists
-        if self.cache_dir.exists():
-            try:
-                # Delete only contents, keep the directory
-                for item in self.cache_dir.iterdir():
-                    if item.is_file():
-                        item.unlink()  # Remove files
-                    elif item.is_dir():
-                        shutil.rmtree(item)  # Remove subdirectories
-                print("Cleared existing cache directory")
-            except (PermissionError, OSError) as e:
-                print(f"Warning: Could not clear cache directory: {e}")
-        
-        # Create cache directory if it doesn't exist
+        # Create cache directory if it doesn't exist, earlier results are kept and reused
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.response_cache = OverpassCache(self.cache_dir)
+        self.file_suffix = GeoFileIO.suffix(file_format)
+        self.output_paths = {}
 
-    def dms_to_decimal(self, degrees, minutes, seconds, direction):
-        """Convert DMS (Degrees, Minutes, Seconds) to Decimal Degrees."""
-        decimal = degrees + (minutes / 60) + (seconds / 3600)
-        return -decimal if direction in ['S', 'W'] else decimal
 
-    def parse_dms(self, dms_str):
-        """Parse DMS string (e.g. 38°24'7.97"N) into decimal degrees."""
-        match = re.match(r"(\d+)°(\d+)'(\d+(?:\.\d+)?)\"([NSEW])", dms_str)
-        if not match:
-            raise ValueError("Invalid DMS format")
-        return self.dms_to_decimal(*map(float, match.groups()[:-1]), match.group(4))
+class MicrosoftDatasetIndex:
+    CSV_URL = "https://minedbuildings.z5.web.core.windows.net/global-buildings/dataset-links.csv"
 
-    def get_osm_data(self, feature_type):
-        """Fetch OSM data for a given feature type."""
-        poly_coords = " ".join(f"{lat} {lon}" for lon, lat in self.aoi_polygon.exterior.coords)
-        query = f'(way["{feature_type}"](poly:"{poly_coords}");); (._;>;); out body;'
-        response = self.overpass.query(query, timeout=120)
-        elements = response.toJSON().get("elements", [])
-        
-        if not elements:
-            print(f"No {feature_type} data found in the area.")
-            return None
-        else:
-            node_coords = {e["id"]: (e["lon"], e["lat"]) for e in elements if e["type"] in ["node"]}
+    def __init__(self, cache_dir="cache"):
+        """
+        SQLite index of the Microsoft Building Footprints dataset-links.csv.
 
-            features = []
-            for element in elements:
-                if element.get("type") == "way" or "nodes" in element:
-                    try:
-                        coords = [node_coords[node_id] for node_id in element["nodes"]]
-                        # Create a Polygon geometry for the building (or other feature)
-                        features.append({"geometry": Polygon(coords), "tags": element.get("tags", {})})
-                    except KeyError:
-                        continue  # Skip incomplete data
-
-            # Explicitly create a GeoDataFrame with the 'geometry' column
-            gdf = gpd.GeoDataFrame(features, geometry="geometry", crs="EPSG:4326")
-            return gdf
+        The CSV is imported once into a table indexed on (quadkey, version), so resolving tile
+        URLs is an indexed lookup instead of a full CSV parse. Rows from several dataset
+        releases can live side by side; lookups use the latest release unless told otherwise.
+        """
+        self.csv_path = Path(cache_dir) / "dataset-links.csv"
+        self.db_path = Path(cache_dir) / "dataset-links.sqlite"
+
+    @staticmethod
+    def version_from_url(url):
+        """Dataset release date embedded in a tile URL, e.g. .../2023-04-25/..."""
+        match = re.search(r"/(\d{4}-\d{2}-\d{2})/", url)
+        return match.group(1) if match else None
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS tiles ("
+            "quadkey TEXT NOT NULL, location TEXT, url TEXT NOT NULL UNIQUE, size TEXT, version TEXT)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS tiles_quadkey_version ON tiles (quadkey, version)")
+        return connection
+
+    def import_csv(self, csv_path=None):
+        """Import (or add a newer release of) dataset-links.csv into the index."""
+        csv_path = Path(csv_path) if csv_path else self.csv_path
+        with open(csv_path, newline="") as f, closing(self._connect()) as connection:
+            rows = (
+                (row["QuadKey"], row.get("Location"), row["Url"], row.get("Size"), self.version_from_url(row["Url"]))
+                for row in csv.DictReader(f)
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO tiles (quadkey, location, url, size, version) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            connection.commit()
 
-    def fetch_osm_data(self):
-        """Fetch OSM data for all feature types (building, amenity, natural)."""
-        datasets = {feature: self.get_osm_data(feature) for feature in self.feature_types}
+    def ensure(self):
+        """Build the index on first use, downloading dataset-links.csv if needed."""
+        if self.db_path.exists():
+            return
+        if not self.csv_path.exists():
+            print("Downloading dataset index...")
+            response = requests.get(self.CSV_URL, timeout=120)
+            response.raise_for_status()
+            self.csv_path.write_bytes(response.content)
+        print("Indexing dataset links...")
+        try:
+            self.import_csv()
+        except Exception:
+            # Never leave a half-built index behind, it would be taken as complete on the next run
+            self.db_path.unlink(missing_ok=True)
+            raise
+
+    def _query(self, where, params, version):
+        """Run a tile lookup, restricted to one release or to the latest release per quadkey."""
+        if version is None:
+            version_filter = "version IS (SELECT MAX(t.version) FROM tiles t WHERE t.quadkey = tiles.quadkey)"
+            version_params = ()
+        else:
+            version_filter = "version = ?"
+            version_params = (version,)
+        self.ensure()
+        with closing(self._connect()) as connection:
+            return connection.execute(
+                f"SELECT quadkey, url FROM tiles WHERE ({where}) AND {version_filter} ORDER BY quadkey, url",
+                (*params, *version_params)
+            ).fetchall()
+
+    def lookup(self, quad_keys, version=None):
+        """(quadkey, url) pairs for a set of quadkeys."""
+        quad_keys = sorted(quad_keys)
+        if not quad_keys:
+            return []
+        return self._query(f"quadkey IN ({', '.join('?' * len(quad_keys))})", quad_keys, version)
+
+    def lookup_prefix(self, prefix, version=None):
+        """(quadkey, url) pairs for every quadkey starting with prefix, i.e. all tiles inside a coarser tile."""
+        # Quadkeys only use the digits 0-3, so "4" sorts after every key sharing the prefix
+        return self._query("quadkey >= ? AND quadkey < ?", (prefix, prefix + "4"), version)
+
+    def versions(self):
+        """Dataset releases present in the index."""
+        self.ensure()
+        with closing(self._connect()) as connection:
+            return [row[0] for row in connection.execute("SELECT DISTINCT version FROM tiles ORDER BY version")]
+
+
+class MicrosoftTileStore:
+    def __init__(self, cache_dir="cache", row_group_size=20000):
+        """
+        Local store of downloaded Microsoft Building Footprints tiles.
 
-        if datasets is None:
-            print("No data found for the given feature types.")
-            return None
+        Each source tile is written once as GeoParquet, sorted along a Hilbert curve and with
+        bbox covering columns, so a later AOI only reads the row groups that overlap it.
+        manifest.json records the quadkey, source URL and dataset version of every stored tile.
+        """
+        self.store_dir = Path(cache_dir) / "msft_tiles"
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.store_dir / "manifest.json"
+        self.row_group_size = row_group_size
+        self._lock = threading.Lock()
+
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r") as f:
+                self.manifest = json.load(f)
         else:
-            # Save Data as GeoJSON
-            for feature, data in datasets.items():
-                if feature in ["amenity", "natural"]:
-                    return None
-                else:
-                    filename = self.cache_dir / f"osm_{feature}.geojson"
-                    data.to_file(filename, driver="GeoJSON")
-                    print(f"Saved: {filename}")
+            self.manifest = {"tiles": {}}
+
+    def has(self, url):
+        """Whether the tile behind a source URL is already stored locally."""
+        entry = self.manifest["tiles"].get(url)
+        return entry is not None and (self.store_dir / entry["file"]).exists()
+
+    def write(self, quad_key, url, gdf):
+        """Persist one downloaded tile and record it in the manifest."""
+        filename = f"{quad_key}_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}.parquet"
+        if len(gdf):
+            gdf = gdf.iloc[np.argsort(gdf.geometry.hilbert_distance(), kind="stable")]
+        tmp_path = self.store_dir / f"{filename}.{threading.get_ident()}.tmp"
+        gdf.to_parquet(tmp_path, index=False, write_covering_bbox=True, row_group_size=self.row_group_size)
+        os.replace(tmp_path, self.store_dir / filename)
+
+        with self._lock:
+            self.manifest["tiles"][url] = {
+                "quadkey": quad_key,
+                "version": MicrosoftDatasetIndex.version_from_url(url),
+                "file": filename,
+                "rows": len(gdf),
+                "stored_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+            tmp_manifest = self.manifest_path.with_suffix(".json.tmp")
+            with open(tmp_manifest, "w") as f:
+                json.dump(self.manifest, f, indent=2)
+            os.replace(tmp_manifest, self.manifest_path)
 
-            return datasets
+    def read(self, url, bbox):
+        """Read the footprints of a stored tile that fall inside a (minx, miny, maxx, maxy) bbox."""
+        entry = self.manifest["tiles"][url]
+        return gpd.read_parquet(self.store_dir / entry["file"], bbox=bbox)
 
 
 class MicrosoftBuildingFootprints:
-    def __init__(self, aoi_polygon, cache_dir="cache"):
+    # First vertex of a footprint record, read without parsing the whole JSON line
+    FIRST_VERTEX = re.compile(rb'"coordinates"\s*:\s*\[\s*\[\s*\[\s*(-?[\d.eE+-]+)\s*,\s*(-?[\d.eE+-]+)')
+
+    def __init__(self, aoi_polygon, cache_dir="cache", max_workers=4, use_tile_store=True, file_format="parquet"):
         """Initializes the MicrosoftBuildingFootprints class."""
         self.aoi_polygon = aoi_polygon
         self.cache_dir = Path(cache_dir)
+        self.file_suffix = GeoFileIO.suffix(file_format)
+        self.max_workers = max_workers
+        self.use_tile_store = use_tile_store
+        self.tile_store = MicrosoftTileStore(self.cache_dir) if use_tile_store else None
+        self.dataset_index = MicrosoftDatasetIndex(self.cache_dir)
 
-    def download_microsoft_building_footprints(self):
-        """Download and filter Microsoft Building Footprints within AOI, or load from cache."""
-        msft_output_path = self.cache_dir / "microsoft_footprints.geojson"
+    def _download_tile(self, url, bbox=None):
+        """
+        Stream one gzip-compressed JSON-lines footprint tile and decode it line by line.
+
+        If a (minx, miny, maxx, maxy) bbox is given, records whose first vertex lies outside it are
+        rejected before their JSON is parsed. Simple polygons are collected as flat coordinate
+        arrays and turned into geometries in one bulk call.
+        """
+        heights, confidences, coords, ring_lengths, simple = [], [], [], [], []
+        other_geometries = {}
+        with requests.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            stream = gzip.GzipFile(fileobj=response.raw) if url.endswith(".gz") else response.raw
+            for line in stream:
+                if not line.strip():
+                    continue
+                if bbox is not None:
+                    match = self.FIRST_VERTEX.search(line)
+                    if match:
+                        lon, lat = float(match.group(1)), float(match.group(2))
+                        if not (bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3]):
+                            continue
+
+                record = json.loads(line)
+                geometry = record["geometry"]
+                properties = record.get("properties") or {}
+                heights.append(properties.get("height"))
+                confidences.append(properties.get("confidence"))
+                if geometry["type"] == "Polygon" and len(geometry["coordinates"]) == 1:
+                    ring = geometry["coordinates"][0]
+                    coords.extend(ring)
+                    ring_lengths.append(len(ring))
+                    simple.append(len(heights) - 1)
+                else:
+                    other_geometries[len(heights) - 1] = shape(geometry)
+
+        geometries = np.empty(len(heights), dtype=object)
+        if simple:
+            ring_index = np.repeat(np.arange(len(simple)), ring_lengths)
+            rings = shapely.linearrings(np.asarray(coords, dtype=np.float64)[:, :2], indices=ring_index)
+            geometries[simple] = shapely.polygons(rings)
+        for position, geometry in other_geometries.items():
+            geometries[position] = geometry
+
+        return gpd.GeoDataFrame(
+            self.typed_columns(heights, confidences),
+            geometry=gpd.GeoSeries(geometries, crs="EPSG:4326"), crs="EPSG:4326"
+        )
+
+    @staticmethod
+    def typed_columns(heights, confidences):
+        """Typed columns for Microsoft footprints, unknown heights and confidences (-1) become NaN."""
+        heights = pd.to_numeric(pd.Series(heights, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        confidences = pd.to_numeric(pd.Series(confidences, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        return {
+            "height": np.where(heights > 0, heights, np.nan),
+            "confidence": np.where(confidences >= 0, confidences, np.nan),
+        }
+
+    @classmethod
+    def normalize(cls, gdf):
+        """Convert footprints stored with the older nested 'properties' column to the typed columns."""
+        if "properties" not in gdf.columns:
+            return gdf
+        properties = [
+            json.loads(props) if isinstance(props, str) else props if isinstance(props, dict) else {}
+            for props in gdf["properties"]
+        ]
+        columns = cls.typed_columns([p.get("height") for p in properties], [p.get("confidence") for p in properties])
+        return gpd.GeoDataFrame(columns, geometry=gdf.geometry.to_numpy(), crs=gdf.crs)
+
+    def _store_tile(self, tile):
+        """Download one (quadkey, url) tile into the local tile store."""
+        quad_key, url = tile
+        self.tile_store.write(quad_key, url, self._download_tile(url))
+
+    def download_microsoft_building_footprints(self, writer=None):
+        """
+        Download and filter Microsoft Building Footprints within AOI, or load from cache.
+
+        The footprints are saved as the AOI cache file, in the background if a BackgroundWriter is given.
+        """
+        # The cache directory persists between runs, so tie the cached footprints to their AOI
+        aoi_key = hashlib.sha256(wkt.dumps(self.aoi_polygon.normalize(), rounding_precision=7).encode("utf-8")).hexdigest()
+        msft_output_path = self.cache_dir / f"microsoft_footprints_{aoi_key[:16]}{self.file_suffix}"
 
         # Check if cached data exists, if so, return it directly
         if msft_output_path.exists():
             print("Loading Microsoft Building Footprints from cache...")
-            combined_gdf = gpd.read_file(msft_output_path)
+            combined_gdf = self.normalize(GeoFileIO.read(msft_output_path))
             return combined_gdf, msft_output_path
 
         # Otherwise, download the data
@@ -251,194 +979,905 @@ class MicrosoftBuildingFootprints:
         aoi_bounds = self.aoi_polygon.bounds
         quad_keys = {mercantile.quadkey(tile) for tile in mercantile.tiles(*aoi_bounds, zooms=9)}
 
-        csv_url = "https://minedbuildings.z5.web.core.windows.net/global-buildings/dataset-links.csv"
-        csv_path = self.cache_dir / "dataset-links.csv"
+        tiles = self.dataset_index.lookup(quad_keys)
 
-        if not csv_path.exists():
-            print("Downloading dataset index...")
-            df = pd.read_csv(csv_url, dtype=str)
-            df.to_csv(csv_path, index=False)
+        if self.use_tile_store:
+            missing = [tile for tile in tiles if not self.tile_store.has(tile[1])]
+            print(f"The input area spans {len(tiles)} tiles, {len(missing)} of them not yet stored locally.")
+
+            # Download missing tiles concurrently into the local tile store
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(tqdm(
+                    executor.map(self._store_tile, missing),
+                    total=len(missing), desc="Downloading Microsoft Footprints"
+                ))
+
+            # Read only the stored rows around the AOI and merge the Microsoft data once at the end
+            tile_gdfs = [self.normalize(self.tile_store.read(url, aoi_bounds)) for _, url in tiles]
         else:
-            df = pd.read_csv(csv_path, dtype=str)
+            print(f"The input area spans {len(tiles)} tiles.")
 
-        quad_urls = df[df["QuadKey"].isin(quad_keys)]["Url"].tolist()
-        print(f"The input area spans {len(quad_urls)} tiles.")
+            # Stream the tiles concurrently, keeping only records that start inside the AOI bbox
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                tile_gdfs = list(tqdm(
+                    executor.map(lambda tile: self._download_tile(tile[1], bbox=aoi_bounds), tiles),
+                    total=len(tiles), desc="Downloading Microsoft Footprints"
+                ))
 
-        # Merge Microsoft data
-        combined_gdf = gpd.GeoDataFrame()
-        with tempfile.TemporaryDirectory() as tmpdir:
-            for url in tqdm(quad_urls, desc="Downloading Microsoft Footprints"):
-                df_msft = pd.read_json(url, lines=True)
-                df_msft["geometry"] = df_msft["geometry"].apply(shape)
-                gdf_msft = gpd.GeoDataFrame(df_msft, crs="EPSG:4326")
-                combined_gdf = pd.concat([combined_gdf, gdf_msft], ignore_index=True)
+        if tile_gdfs:
+            combined_gdf = gpd.GeoDataFrame(pd.concat(tile_gdfs, ignore_index=True), geometry="geometry", crs="EPSG:4326")
+        else:
+            combined_gdf = gpd.GeoDataFrame(
+                self.typed_columns([], []), geometry=gpd.GeoSeries([], crs="EPSG:4326"), crs="EPSG:4326"
+            )
 
-        # Filter geometries within AOI and save
-        combined_gdf = combined_gdf[combined_gdf.geometry.within(self.aoi_polygon)]
-        combined_gdf.to_file(msft_output_path, driver="GeoJSON")
-        print("Saved Microsoft footprints.")
+        # Filter geometries within AOI with a prepared geometry and save
+        shapely.prepare(self.aoi_polygon)
+        combined_gdf = combined_gdf[shapely.contains(self.aoi_polygon, combined_gdf.geometry.to_numpy())]
+        if writer is not None:
+            writer.submit(combined_gdf, msft_output_path)
+        else:
+            GeoFileIO.write(combined_gdf, msft_output_path)
+            print("Saved Microsoft footprints.")
 
         return combined_gdf, msft_output_path
 
 
 class DataMerger:
-    def __init__(self, cache_dir="cache"):
+    # "intersects" treats any touching Microsoft polygon as a duplicate, "overlap" requires the
+    # intersection to cover dedup_threshold of the Microsoft polygon, "iou" requires an
+    # intersection-over-union of at least dedup_threshold
+    DEDUP_MODES = ("intersects", "overlap", "iou")
+
+    # Columns and dtypes of the merged buildings, identical for every partition and output format
+    MERGED_COLUMNS = {
+        "osm_id": "Int64", "height": "float64", "levels": "Int16",
+        "building": "string", "source": "string", "confidence": "float64",
+    }
+
+    def __init__(self, cache_dir="cache", dedup_mode="intersects", dedup_threshold=0.5, file_format="parquet", export_geojson=False):
         """Initializes the DataMerger class."""
+        if dedup_mode not in self.DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode '{dedup_mode}', expected one of {self.DEDUP_MODES}")
         self.cache_dir = Path(cache_dir)
+        self.dedup_mode = dedup_mode
+        self.dedup_threshold = dedup_threshold
+        self.file_suffix = GeoFileIO.suffix(file_format)
+        # Additionally write merged_polygons.geojson as a final artifact for other tools
+        self.export_geojson = export_geojson
+
+    def _heights(self, gdf):
+        """The typed height column as a float array, NaN where unknown."""
+        if "height" in gdf.columns:
+            heights = pd.to_numeric(gdf["height"], errors="coerce")
+        else:
+            heights = pd.Series(np.nan, index=gdf.index)
+        heights = heights.to_numpy(dtype=np.float64, copy=True)
+        heights[heights <= 0] = np.nan
+        return heights
+
+    def intersecting_pairs(self, osm_gdf, msft_gdf):
+        """All intersecting (Microsoft, OSM) positional index pairs from one bulk STRtree query."""
+        msft_idx, osm_idx = osm_gdf.sindex.query(msft_gdf.geometry, predicate="intersects")
+        return msft_idx, osm_idx
+
+    def matching_pairs(self, osm_gdf, msft_gdf, pairs):
+        """
+        Keep the intersecting pairs that count as duplicates under the configured dedup mode.
+
+        Intersection areas for all candidate pairs are computed in one vectorized call.
+        """
+        if self.dedup_mode == "intersects":
+            return pairs
+        msft_idx, osm_idx = pairs
+        msft_geoms = msft_gdf.geometry.to_numpy()[msft_idx]
+        osm_geoms = osm_gdf.geometry.to_numpy()[osm_idx]
+        intersection = shapely.area(shapely.intersection(msft_geoms, osm_geoms))
+        msft_area = shapely.area(msft_geoms)
+        if self.dedup_mode == "overlap":
+            denominator = msft_area
+        else:
+            denominator = msft_area + shapely.area(osm_geoms) - intersection
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(denominator > 0, intersection / denominator, 0.0)
+        keep = ratio >= self.dedup_threshold
+        return msft_idx[keep], osm_idx[keep]
+
+    def _overlap_mask(self, msft_gdf, pairs):
+        """Boolean mask of the Microsoft footprints that take part in at least one pair."""
+        overlapping = np.zeros(len(msft_gdf), dtype=bool)
+        overlapping[pairs[0]] = True
+        return overlapping
+
+    def transfer_heights(self, osm_gdf, msft_gdf, pairs=None):
+        """
+        Copy Microsoft heights onto intersecting OSM buildings that have no height tag.
+
+        An OSM building touched by several Microsoft footprints takes the tallest of them.
+        """
+        msft_heights = self._heights(msft_gdf)
+        osm_heights = self._heights(osm_gdf)
+        msft_idx, osm_idx = pairs if pairs is not None else self.intersecting_pairs(osm_gdf, msft_gdf)
+        usable = ~np.isnan(msft_heights[msft_idx]) & np.isnan(osm_heights[osm_idx])
+
+        heights = pd.Series(msft_heights[msft_idx[usable]]).groupby(osm_idx[usable]).max()
+        osm_heights[heights.index.to_numpy()] = heights.to_numpy()
+        osm_gdf = osm_gdf.copy()
+        osm_gdf["height"] = osm_heights
+        return osm_gdf, len(heights)
+
+    def _combine(self, osm_gdf, msft_gdf):
+        """Concatenate OSM and Microsoft rows, recording the source of each and marking footprints as buildings."""
+        merged = pd.concat(
+            [osm_gdf.assign(source="osm"), msft_gdf.assign(source="microsoft", building="yes")], ignore_index=True
+        )
+        merged = merged.reindex(columns=[*self.MERGED_COLUMNS, "geometry"]).astype(self.MERGED_COLUMNS)
+        return gpd.GeoDataFrame(merged, geometry="geometry", crs="EPSG:4326")
+
+    def merge(self, osm_gdf, msft_gdf):
+            """Merge in-memory OSM and Microsoft Building Footprints data, removing duplicates."""
+            msft_gdf = MicrosoftBuildingFootprints.normalize(msft_gdf)
+
+            # Find every intersecting (Microsoft, OSM) pair once, against the individual OSM polygons,
+            # and keep the ones that count as duplicates under the dedup mode
+            pairs = self.matching_pairs(osm_gdf, msft_gdf, self.intersecting_pairs(osm_gdf, msft_gdf))
 
-    def merge_and_deduplicate_data(self, osm_output_path, msft_output_path):
-            """Merge OSM and Microsoft Building Footprints data, removing duplicates."""
-            osm_gdf = gpd.read_file(osm_output_path)
-            msft_gdf = gpd.read_file(msft_output_path[0])
-            
             # Check and transfer height data from Microsoft to OSM where applicable
-            # Create spatial index for OSM data for efficient lookup
-            osm_sindex = osm_gdf.sindex
-            
-            # Track which buildings we've updated
-            updated_count = 0
-            
-            # Check each Microsoft building to see if it intersects with OSM
-            for idx, msft_row in msft_gdf.iterrows():
-                # Check if Microsoft building has height data
-                msft_height = msft_row.get('height')
-                if msft_height:
-                    # Find intersecting OSM buildings
-                    possible_matches_idx = list(osm_sindex.intersection(msft_row.geometry.bounds))
-                    if possible_matches_idx:
-                        for osm_idx in possible_matches_idx:
-                            # Check if buildings actually intersect
-                            if msft_row.geometry.intersects(osm_gdf.iloc[osm_idx].geometry):
-                                # Check if OSM building doesn't have height data
-                                if 'tags' in osm_gdf.iloc[osm_idx] and isinstance(osm_gdf.iloc[osm_idx]['tags'], dict):
-                                    if 'height' not in osm_gdf.iloc[osm_idx]['tags']:
-                                        # Add height data from Microsoft to OSM
-                                        if osm_gdf.iloc[osm_idx]['tags'] is None:
-                                            osm_gdf.iloc[osm_idx, osm_gdf.columns.get_loc('tags')] = {}
-                                        osm_gdf.iloc[osm_idx, osm_gdf.columns.get_loc('tags')]['height'] = msft_height
-                                        updated_count += 1
+            osm_gdf, updated_count = self.transfer_heights(osm_gdf, msft_gdf, pairs)
             
             print(f"Added height data to {updated_count} OSM buildings from Microsoft data.")
 
-            # Remove overlapping Microsoft polygons using spatial join
-            msft_gdf_cleaned = msft_gdf[~msft_gdf.geometry.intersects(osm_gdf.unary_union)]
+            # Remove overlapping Microsoft polygons
+            msft_gdf_cleaned = msft_gdf[~self._overlap_mask(msft_gdf, pairs)]
 
             # Check if any Microsoft data was removed (i.e., if there was an intersection)
-            if msft_gdf_cleaned.empty:
+            if len(msft_gdf_cleaned) == len(msft_gdf):
                 print("No Microsoft polygons were removed. Using all Microsoft data.")
                 # If no intersection occurred, just use all the Microsoft Footprints data
-                merged_gdf = pd.concat([osm_gdf, msft_gdf], ignore_index=True)
+                merged_gdf = self._combine(osm_gdf, msft_gdf)
             else:
                 # Otherwise, proceed with the cleaned data
                 print(f"Removed {len(msft_gdf) - len(msft_gdf_cleaned)} Microsoft polygons due to overlap.")
-                merged_gdf = pd.concat([osm_gdf, msft_gdf_cleaned], ignore_index=True)
-
-            # Save the merged GeoDataFrame to file (GeoJSON format)
-            merged_output_path = self.cache_dir / "merged_polygons.geojson"
-            merged_gdf.to_file(merged_output_path, driver="GeoJSON")
+                merged_gdf = self._combine(osm_gdf, msft_gdf_cleaned)
+
+            return merged_gdf
+
+    def save_merged(self, merged_gdf, writer=None):
+        """Save the merged buildings for the next stage, and as GeoJSON if requested, in the background if a BackgroundWriter is given."""
+        merged_output_path = self.cache_dir / f"merged_polygons{self.file_suffix}"
+        outputs = [merged_output_path]
+        if self.export_geojson and merged_output_path.suffix != ".geojson":
+            outputs.append(self.cache_dir / "merged_polygons.geojson")
+        for path in outputs:
+            if writer is not None:
+                writer.submit(merged_gdf, path)
+            else:
+                GeoFileIO.write(merged_gdf, path)
+        if writer is None:
             print("Merged dataset saved.")
+        return merged_output_path
+
+    def merge_and_deduplicate_data(self, osm_output_path, msft_output_path):
+            """Merge OSM and Microsoft Building Footprints data files, removing duplicates."""
+            osm_gdf = GeoFileIO.read(osm_output_path)
+            msft_gdf = GeoFileIO.read(msft_output_path[0])
+            merged_gdf = self.merge(osm_gdf, msft_gdf)
+
+            # Save the merged GeoDataFrame for the next stage
+            merged_output_path = self.save_merged(merged_gdf)
 
             return merged_gdf, merged_output_path
     
+    @staticmethod
+    def _cells(bounds, origin, tile_size):
+        """Grid cell (column, row) of every bbox center, bounds given as (minx, miny, maxx, maxy) rows."""
+        return np.stack([
+            np.floor(((bounds[0] + bounds[2]) / 2 - origin[0]) / tile_size),
+            np.floor(((bounds[1] + bounds[3]) / 2 - origin[1]) / tile_size),
+        ], axis=1)
+
+    def _owned(self, gdf, cell, origin, tile_size):
+        """
+        Rows owned by a grid cell: those whose bbox center lies in it.
+
+        Every building has exactly one center, so it is owned by exactly one tile of the grid.
+        """
+        return (self._cells(gdf.geometry.bounds.to_numpy().T, origin, tile_size) == cell).all(axis=1)
+
+    def _merge_partition(self, task):
+        """
+        Merge one tile of the grid and write the result as a GeoParquet part.
+
+        Both inputs are read for a window covering the bboxes of the tile's own buildings, so every
+        polygon that can intersect an owned one is present as context. Only owned rows are written.
+        """
+        index, cell, origin, tile_size, window, osm_path, msft_path, parts_dir = task
+        osm_gdf = GeoFileIO.read(osm_path, bbox=window)
+        msft_gdf = MicrosoftBuildingFootprints.normalize(GeoFileIO.read(msft_path, bbox=window))
+
+        pairs = self.matching_pairs(osm_gdf, msft_gdf, self.intersecting_pairs(osm_gdf, msft_gdf))
+        osm_owned = self._owned(osm_gdf, cell, origin, tile_size)
+        msft_owned = self._owned(msft_gdf, cell, origin, tile_size)
+        had_height = ~np.isnan(self._heights(osm_gdf))
+
+        osm_gdf, _ = self.transfer_heights(osm_gdf, msft_gdf, pairs)
+        has_height = ~np.isnan(self._heights(osm_gdf))
+        overlapping = self._overlap_mask(msft_gdf, pairs)
+
+        merged_gdf = self._combine(osm_gdf[osm_owned], msft_gdf[msft_owned & ~overlapping])
+        part_path = Path(parts_dir) / f"part_{index:06d}.parquet"
+        GeoFileIO.write(merged_gdf, part_path)
+
+        updated = int((has_height & ~had_height & osm_owned).sum())
+        removed = int((msft_owned & overlapping).sum())
+        return part_path, updated, removed
+
+    def merge_partitioned(self, osm_output_path, msft_output_path, tile_size=0.01, max_workers=None, return_gdf=False):
+        """
+        Merge OSM and Microsoft Building Footprints tile by tile in a process pool.
+
+        Produces the same result as merge_and_deduplicate_data, but only one tile (plus a halo)
+        of each input is held in memory per worker, and the inputs are read with bbox filters. The
+        merged file is written one part at a time; the merged GeoDataFrame is only assembled in
+        memory when return_gdf is True.
+        """
+        osm_bounds = GeoFileIO.bounds(osm_output_path)
+        msft_bounds = GeoFileIO.bounds(msft_output_path)
+        all_bounds = np.concatenate([osm_bounds, msft_bounds], axis=1)
+        merged_output_path = self.cache_dir / f"merged_polygons{self.file_suffix}"
+        geojson_output_path = self.cache_dir / "merged_polygons.geojson"
+        merged_output_path.unlink(missing_ok=True)
+        export_geojson = self.export_geojson and merged_output_path != geojson_output_path
+        if export_geojson:
+            geojson_output_path.unlink(missing_ok=True)
+        if all_bounds.shape[1] == 0:
+            print("No buildings to merge.")
+            return None, merged_output_path
+
+        # Grid tiles that own at least one building, keyed by the cell of each bbox center. A tile
+        # reads the union of its owned bboxes, so one huge building only widens its own tile's window
+        origin = (float(all_bounds[0].min()), float(all_bounds[1].min()))
+        cells, owner = np.unique(self._cells(all_bounds, origin, tile_size), axis=0, return_inverse=True)
+        owner = owner.ravel()
+        windows = np.tile([np.inf, np.inf, -np.inf, -np.inf], (len(cells), 1))
+        np.minimum.at(windows[:, 0], owner, all_bounds[0])
+        np.minimum.at(windows[:, 1], owner, all_bounds[1])
+        np.maximum.at(windows[:, 2], owner, all_bounds[2])
+        np.maximum.at(windows[:, 3], owner, all_bounds[3])
+
+        parts_dir = self.cache_dir / "merge_parts"
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        parts_dir.mkdir(parents=True, exist_ok=True)
+        tasks = [
+            (i, cell, origin, tile_size, tuple(window.tolist()), str(osm_output_path), str(msft_output_path), str(parts_dir))
+            for i, (cell, window) in enumerate(zip(cells, windows))
+        ]
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(tqdm(executor.map(self._merge_partition, tasks), total=len(tasks), desc="Merging tiles"))
+
+        # Every part has the MERGED_COLUMNS schema, so GeoParquet parts are copied as row groups of one
+        # file and other formats are appended to
+        part_gdfs = []
+        writer = None
+        for part_path, _, _ in results:
+            if merged_output_path.suffix == ".parquet":
+                table = pq.read_table(part_path)
+                if writer is None:
+                    # The per-file bbox in the geo metadata only describes the first part
+                    geo = json.loads(table.schema.metadata[b"geo"])
+                    geo["columns"]["geometry"].pop("bbox", None)
+                    schema = table.schema.with_metadata({**table.schema.metadata, b"geo": json.dumps(geo).encode("utf-8")})
+                    writer = pq.ParquetWriter(merged_output_path, schema)
+                writer.write_table(table.cast(writer.schema))
+                if not (export_geojson or return_gdf):
+                    continue
+            part_gdf = gpd.read_parquet(part_path)
+            if len(part_gdf):
+                if merged_output_path.suffix != ".parquet":
+                    GeoFileIO.write(part_gdf, merged_output_path, mode="a" if merged_output_path.exists() else "w")
+                if export_geojson:
+                    GeoFileIO.write(part_gdf, geojson_output_path, mode="a" if geojson_output_path.exists() else "w")
+            if return_gdf:
+                part_gdfs.append(part_gdf)
+        if writer is not None:
+            writer.close()
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+        print(f"Added height data to {sum(r[1] for r in results)} OSM buildings from Microsoft data.")
+        print(f"Removed {sum(r[2] for r in results)} Microsoft polygons due to overlap.")
+        print("Merged dataset saved.")
+
+        merged_gdf = gpd.GeoDataFrame(pd.concat(part_gdfs, ignore_index=True), crs="EPSG:4326") if part_gdfs else None
+        return merged_gdf, merged_output_path
+
     def remove_intersecting_msft_data(self, osm_output_path, msft_output_path):
         """Keep only Microsoft Building Footprints that do not intersect with OSM buildings."""
-        osm_gdf = gpd.read_file(osm_output_path)
-        msft_gdf = gpd.read_file(msft_output_path)
+        osm_gdf = GeoFileIO.read(osm_output_path)
+        msft_gdf = MicrosoftBuildingFootprints.normalize(GeoFileIO.read(msft_output_path))
 
         # Remove overlapping Microsoft polygons
-        msft_gdf_filtered = msft_gdf[~msft_gdf.geometry.intersects(osm_gdf.unary_union)]
+        msft_gdf_filtered = msft_gdf[~self._overlap_mask(msft_gdf, self.intersecting_pairs(osm_gdf, msft_gdf))]
 
         print(f"Removed {len(msft_gdf) - len(msft_gdf_filtered)} Microsoft polygons due to intersection.")
 
         # Save the remaining Microsoft footprints
-        msft_filtered_output_path = self.cache_dir / "msft_filtered.geojson"
-        msft_gdf_filtered.to_file(msft_filtered_output_path, driver="GeoJSON")
+        msft_filtered_output_path = self.cache_dir / f"msft_filtered{self.file_suffix}"
+        GeoFileIO.write(msft_gdf_filtered, msft_filtered_output_path)
         print(f"Filtered Microsoft dataset saved to {msft_filtered_output_path}")
 
         return msft_gdf_filtered, msft_filtered_output_path    
 
 
+class VectorTileWriter:
+    def __init__(self, output_dir, extent=4096, buffer=64):
+        """
+        Encoder for a local z/x/y pyramid of Mapbox Vector Tiles (specification 2.1).
+
+        Geometries are projected once to normalized Web Mercator, simplified to one tile pixel per
+        zoom level, clipped per tile and encoded in bulk with NumPy. Only (multi)polygon layers are
+        written. buffer is the margin in tile pixels drawn around each tile to hide seams.
+        """
+        self.output_dir = Path(output_dir)
+        self.extent = extent
+        self.buffer = buffer
+
+    @staticmethod
+    def lonlat_geometries(gdf):
+        """Geometry array of a GeoDataFrame in EPSG:4326."""
+        if gdf.crs is not None and not gdf.crs.equals("EPSG:4326"):
+            gdf = gdf.to_crs("EPSG:4326")
+        return gdf.geometry.to_numpy()
+
+    @staticmethod
+    def project(coords):
+        """Project an (n, 2) lon/lat array to normalized Web Mercator: x and y in [0, 1], y pointing south like tile rows."""
+        lon = coords[:, 0]
+        lat = np.radians(np.clip(coords[:, 1], -85.0511287798, 85.0511287798))
+        x = (lon + 180.0) / 360.0
+        y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+        return np.column_stack([x, y])
+
+    @classmethod
+    def to_world(cls, gdf):
+        """Geometries in normalized Web Mercator."""
+        return shapely.transform(cls.lonlat_geometries(gdf), cls.project)
+
+    @staticmethod
+    def _varints(values):
+        """Protobuf varint encoding of non-negative integers as one byte array, plus the byte count of each value."""
+        values = np.asarray(values, dtype=np.uint64)
+        nbytes = np.ones(len(values), dtype=np.int64)
+        for shift in range(7, 64, 7):
+            nbytes += values >= (np.uint64(1) << np.uint64(shift))
+        starts = np.cumsum(nbytes) - nbytes
+        encoded = np.empty(int(nbytes.sum()), dtype=np.uint8)
+        for k in range(int(nbytes.max()) if len(values) else 0):
+            mask = nbytes > k
+            byte = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+            encoded[starts[mask] + k] = byte | np.where(nbytes[mask] > k + 1, 0x80, 0).astype(np.uint64)
+        return encoded, nbytes
+
+    @classmethod
+    def _varint(cls, value):
+        return cls._varints([value])[0].tobytes()
+
+    @classmethod
+    def _message(cls, field, payload):
+        """A length-delimited protobuf field."""
+        return cls._varint(field << 3 | 2) + cls._varint(len(payload)) + payload
+
+    @staticmethod
+    def _zigzag(values):
+        values = np.asarray(values, dtype=np.int64)
+        return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+    @classmethod
+    def _value(cls, value):
+        """Encode one attribute value as a vector tile Value message."""
+        if isinstance(value, (bool, np.bool_)):
+            return b"\x38" + cls._varint(int(value))
+        if isinstance(value, (int, np.integer)):
+            return b"\x30" + cls._varint(int(cls._zigzag([int(value)])[0]))
+        if isinstance(value, (float, np.floating)):
+            return b"\x19" + struct.pack("<d", float(value))
+        return cls._message(1, str(value).encode("utf-8"))
+
+    def _encode_polygons(self, geometries, origin, scale):
+        """
+        Polygon command streams for a tile, all features at once.
+
+        Returns the flat command integers, the feature each command belongs to, and the positions
+        of the features that kept at least one ring after quantization to tile pixels.
+        """
+        parts, part_feature = shapely.get_parts(geometries, return_index=True)
+        polygonal = shapely.get_type_id(parts) == 3
+        parts, part_feature = parts[polygonal], part_feature[polygonal]
+        rings, ring_part = shapely.get_rings(parts, return_index=True)
+        coords, point_ring = shapely.get_coordinates(rings, return_index=True)
+        if not len(coords):
+            return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        points = np.rint((coords - origin) * scale).astype(np.int64)
+
+        # Quantize: keep a point only if it moved from the previous one, then drop the closing point
+        keep = np.ones(len(points), dtype=bool)
+        keep[1:] = (point_ring[1:] != point_ring[:-1]) | (points[1:] != points[:-1]).any(axis=1)
+        points, point_ring = points[keep], point_ring[keep]
+        counts = np.bincount(point_ring, minlength=len(rings))
+        starts = np.cumsum(counts) - counts
+        last = starts + counts - 1
+        closes_ring = np.zeros(len(rings), dtype=bool)
+        closes_ring[counts > 1] = (points[last[counts > 1]] == points[starts[counts > 1]]).all(axis=1)
+        keep = np.ones(len(points), dtype=bool)
+        keep[last[closes_ring]] = False
+        points, point_ring = points[keep], point_ring[keep]
+        counts = np.bincount(point_ring, minlength=len(rings))
+        starts = np.cumsum(counts) - counts
+
+        # Twice the signed ring area (surveyor's formula in tile pixels, y down)
+        following = np.arange(1, len(points) + 1)
+        following[(starts + counts - 1)[counts > 0]] = starts[counts > 0]
+        cross = points[:, 0] * points[following, 1] - points[following, 0] * points[:, 1]
+        area = np.bincount(point_ring, weights=cross, minlength=len(rings))
+
+        # A polygon survives if its exterior ring does, exterior rings must wind with positive area
+        exterior = np.ones(len(rings), dtype=bool)
+        exterior[1:] = ring_part[1:] != ring_part[:-1]
+        valid = (counts >= 3) & (area != 0)
+        part_valid = np.zeros(len(parts), dtype=bool)
+        part_valid[ring_part[exterior]] = valid[exterior]
+        valid &= part_valid[ring_part]
+        reverse = np.where(exterior, area < 0, area > 0)
+
+        kept_rings = np.flatnonzero(valid)
+        counts, starts = counts[kept_rings], starts[kept_rings]
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        reversed_offsets = np.repeat(counts, counts) - 1 - offsets
+        gather = np.repeat(starts, counts) + np.where(np.repeat(reverse[kept_rings], counts), reversed_offsets, offsets)
+        points = points[gather]
+
+        # Cursor deltas, the cursor starts at the tile origin for every feature
+        ring_feature = part_feature[ring_part[kept_rings]]
+        point_feature = np.repeat(ring_feature, counts)
+        deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+        feature_first = np.ones(len(points), dtype=bool)
+        feature_first[1:] = point_feature[1:] != point_feature[:-1]
+        deltas[feature_first] = points[feature_first]
+
+        # MoveTo(1) x y, LineTo(count - 1) x y ..., ClosePath(1) for every ring
+        lengths = 2 * counts + 3
+        ring_start = np.cumsum(lengths) - lengths
+        commands = np.empty(int(lengths.sum()), dtype=np.uint64)
+        commands[ring_start] = 1 | 1 << 3
+        commands[ring_start + 3] = (2 | (counts - 1) << 3).astype(np.uint64)
+        commands[ring_start + lengths - 1] = 7 | 1 << 3
+        position = np.repeat(ring_start, counts) + np.where(offsets == 0, 1, 2 + 2 * offsets)
+        commands[position] = self._zigzag(deltas[:, 0])
+        commands[position + 1] = self._zigzag(deltas[:, 1])
+        return commands, np.repeat(ring_feature, lengths), np.unique(ring_feature)
+
+    def _encode_layer(self, name, geometries, attributes, origin, scale):
+        """Encode one layer of a tile, or return None if no feature is left after quantization."""
+        commands, command_feature, features = self._encode_polygons(geometries, origin, scale)
+        if not len(features):
+            return None
+        geometry_bytes, geometry_nbytes = self._varints(commands)
+        geometry_ends = np.cumsum(np.bincount(np.searchsorted(features, command_feature), weights=geometry_nbytes, minlength=len(features))).astype(np.int64)
+
+        # Attribute keys and values are shared by the layer, each feature refers to them by index
+        attributes = attributes.iloc[features]
+        keys, values, tag_columns = [], [], []
+        for column in attributes.columns:
+            codes, uniques = pd.factorize(attributes[column], use_na_sentinel=True)
+            if not len(uniques):
+                continue
+            tag_columns.append(np.where(codes >= 0, len(keys), -1))
+            tag_columns.append(np.where(codes >= 0, codes + len(values), -1))
+            keys.append(column)
+            values.extend(uniques.tolist())
+        tags = np.column_stack(tag_columns) if tag_columns else np.empty((len(features), 0), dtype=np.int64)
+        tag_bytes, tag_nbytes = self._varints(tags[tags >= 0])
+        tag_ends = np.cumsum(np.bincount(np.nonzero(tags >= 0)[0], weights=tag_nbytes, minlength=len(features))).astype(np.int64)
+
+        layer = [self._message(1, name.encode("utf-8"))]
+        tag_start = geometry_start = 0
+        for tag_end, geometry_end in zip(tag_ends, geometry_ends):
+            feature = (
+                self._message(2, tag_bytes[tag_start:tag_end].tobytes())
+                + b"\x18\x03"
+                + self._message(4, geometry_bytes[geometry_start:geometry_end].tobytes())
+            )
+            layer.append(self._message(2, feature))
+            tag_start, geometry_start = tag_end, geometry_end
+        layer.extend(self._message(3, key.encode("utf-8")) for key in keys)
+        layer.extend(self._message(4, self._value(value)) for value in values)
+        layer.append(b"\x28" + self._varint(self.extent))
+        layer.append(b"\x78\x02")
+        return b"".join(layer)
+
+    def _write_chunk(self, task):
+        """Encode and write a group of tiles of one zoom level, returns the number of tiles written."""
+        zoom, tiles, layers = task
+        tiles_per_side = 2 ** zoom
+        margin = self.buffer / self.extent / tiles_per_side
+        # Simplify once per zoom level to about one tile pixel
+        layers = {
+            name: (shapely.simplify(geometries, 1.0 / (tiles_per_side * self.extent), preserve_topology=True), attributes)
+            for name, (geometries, attributes) in layers.items()
+        }
+
+        written = 0
+        for x, y, members in tiles:
+            minx, miny = x / tiles_per_side, y / tiles_per_side
+            maxx, maxy = (x + 1) / tiles_per_side, (y + 1) / tiles_per_side
+            encoded = []
+            for name, positions in members.items():
+                geometries, attributes = layers[name]
+                clipped = shapely.clip_by_rect(geometries[positions], minx - margin, miny - margin, maxx + margin, maxy + margin)
+                layer = self._encode_layer(
+                    name, clipped, attributes.iloc[positions], np.array([minx, miny]), tiles_per_side * self.extent
+                )
+                if layer is not None:
+                    encoded.append(self._message(3, layer))
+            if encoded:
+                tile_path = self.output_dir / str(zoom) / str(x) / f"{y}.pbf"
+                tile_path.parent.mkdir(parents=True, exist_ok=True)
+                tile_path.write_bytes(b"".join(encoded))
+                written += 1
+        return written
+
+    def _zoom_tasks(self, zoom, layers, chunks):
+        """Split the tiles of one zoom level that contain features into roughly equal work chunks."""
+        tiles_per_side = 2 ** zoom
+        margin = self.buffer / self.extent
+        keys, layer_ids, feature_ids = [], [], []
+        for layer_id, (geometries, _) in enumerate(layers.values()):
+            bounds = shapely.bounds(geometries) * tiles_per_side
+            low = np.clip(np.floor(bounds[:, :2] - margin), 0, tiles_per_side - 1).astype(np.int64)
+            high = np.clip(np.floor(bounds[:, 2:] + margin), 0, tiles_per_side - 1).astype(np.int64)
+            span = high - low + 1
+            per_feature = span[:, 0] * span[:, 1]
+            feature = np.repeat(np.arange(len(geometries)), per_feature)
+            offset = np.arange(per_feature.sum()) - np.repeat(np.cumsum(per_feature) - per_feature, per_feature)
+            tile_x = low[feature, 0] + offset // span[feature, 1]
+            tile_y = low[feature, 1] + offset % span[feature, 1]
+            keys.append(tile_x * tiles_per_side + tile_y)
+            layer_ids.append(np.full(len(feature), layer_id))
+            feature_ids.append(feature)
+
+        keys, layer_ids, feature_ids = np.concatenate(keys), np.concatenate(layer_ids), np.concatenate(feature_ids)
+        order = np.lexsort((feature_ids, layer_ids, keys))
+        keys, layer_ids, feature_ids = keys[order], layer_ids[order], feature_ids[order]
+        tile_keys, tile_starts = np.unique(keys, return_index=True)
+        tile_bounds = np.append(tile_starts, len(keys))
+
+        # Cut the tile list where the cumulative feature count crosses a chunk boundary
+        chunk_of_tile = np.minimum(tile_starts * chunks // max(len(keys), 1), chunks - 1)
+        names = list(layers)
+        tasks = []
+        for chunk in np.unique(chunk_of_tile):
+            chunk_tiles = np.flatnonzero(chunk_of_tile == chunk)
+            rows = slice(tile_bounds[chunk_tiles[0]], tile_bounds[chunk_tiles[-1] + 1])
+            chunk_layers, local = {}, {}
+            for layer_id, name in enumerate(names):
+                used = np.unique(feature_ids[rows][layer_ids[rows] == layer_id])
+                if len(used):
+                    geometries, attributes = layers[name]
+                    chunk_layers[name] = (geometries[used], attributes.iloc[used])
+                    local[layer_id] = used
+            tiles = []
+            for tile in chunk_tiles:
+                start, end = tile_bounds[tile], tile_bounds[tile + 1]
+                members = {
+                    names[layer_id]: np.searchsorted(local[layer_id], feature_ids[start:end][layer_ids[start:end] == layer_id])
+                    for layer_id in np.unique(layer_ids[start:end])
+                }
+                tiles.append((int(tile_keys[tile] // tiles_per_side), int(tile_keys[tile] % tiles_per_side), members))
+            tasks.append((zoom, tiles, chunk_layers))
+        return tasks
+
+    def write(self, layers, min_zoom=12, max_zoom=16, max_workers=None):
+        """
+        Write the tile pyramid for a {layer name: GeoDataFrame} mapping and return the number of tiles.
+
+        The tiles of every zoom level are split into chunks that are encoded in a process pool.
+        """
+        prepared = {}
+        for name, gdf in layers.items():
+            if gdf is None or not len(gdf):
+                continue
+            attributes = pd.DataFrame(gdf.drop(columns=gdf.geometry.name)).reset_index(drop=True)
+            prepared[name] = (self.to_world(gdf), attributes)
+        if not prepared:
+            print("No features to write as vector tiles.")
+            return 0
+
+        # Replace the tiles of an earlier run, other files in output_dir are left alone
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        for zoom_dir in self.output_dir.iterdir():
+            if zoom_dir.is_dir() and zoom_dir.name.isdigit():
+                shutil.rmtree(zoom_dir)
+        chunks = 4 * (max_workers or os.cpu_count() or 1)
+        tasks = [task for zoom in range(min_zoom, max_zoom + 1) for task in self._zoom_tasks(zoom, prepared, chunks)]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            written = sum(tqdm(executor.map(self._write_chunk, tasks), total=len(tasks), desc="Writing vector tiles"))
+        return written
+
+
 class Visualizer:
-    def __init__(self, latitude, longitude):
-        """Initializes the Visualizer class."""
+    # Color mapping for natural feature tags
+    NATURAL_TAG_COLORS = {
+        "wood": "green",
+        "water": "blue",
+        "sand": "yellow",
+        "grass": "lightgreen",
+        "scrub": "darkgreen",
+        "rock": "gray",
+        "mixed": "green",
+        "yes": "red",
+        # Add more tags as needed
+    }
+
+    # Colors used when rendering by data source, and per layer when a layer has no color_by column
+    SOURCE_COLORS = {"osm": "blue", "microsoft": "green"}
+    LAYER_COLORS = {"natural": "green", "amenity": "orange"}
+
+    def __init__(self, latitude, longitude, precision=6, simplify_tolerance=None, smooth_factor=1.0):
+        """
+        Initializes the Visualizer class.
+
+        Coordinates are rounded to precision decimals (6 is about 10 cm) before they are embedded
+        in the map. simplify_tolerance (in degrees) optionally simplifies the geometries up front,
+        and smooth_factor sets how much Leaflet simplifies them further at each zoom level.
+        """
         self.latitude = latitude
         self.longitude = longitude
+        self.precision = precision
+        self.simplify_tolerance = simplify_tolerance
+        self.smooth_factor = smooth_factor
+
+    def _to_geojson(self, gdf, columns=()):
+        """Compact GeoJSON of a dataset: quantized, optionally simplified, with only the given property columns."""
+        if gdf.crs is not None and not gdf.crs.equals("EPSG:4326"):
+            gdf = gdf.to_crs("EPSG:4326")
+        geometry = gdf.geometry.to_numpy()
+        if self.simplify_tolerance:
+            geometry = shapely.simplify(geometry, self.simplify_tolerance, preserve_topology=True)
+        geometry = shapely.transform(geometry, lambda coords: np.round(coords, self.precision))
+        columns = [column for column in columns if column in gdf.columns]
+        return gpd.GeoDataFrame(gdf[columns].reset_index(drop=True), geometry=geometry, crs="EPSG:4326").to_json()
+
+    def _add_layer(self, m, gdf, name, style_function, columns=()):
+        """Add a whole dataset to the map as one GeoJson layer."""
+        folium.GeoJson(
+            self._to_geojson(gdf, columns),
+            name=name,
+            style_function=style_function,
+            smooth_factor=self.smooth_factor,
+        ).add_to(m)
 
     def visualize_data(self, data=None, additional_datasets=None, name="merged_and_additional_data_map"):
         """Visualize fetched OSM data and optionally merged data on a Folium map."""
         m = folium.Map(location=[self.latitude, self.longitude], zoom_start=14, tiles="https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}", attr="Google Maps")
 
-        # Define a color mapping for natural feature tags
-        natural_tag_colors = {
-            "wood": "green",
-            "water": "blue",
-            "sand": "yellow",
-            "grass": "lightgreen",
-            "scrub": "darkgreen",
-            "rock": "gray",
-            "mixed": "green",
-            "yes": "red",
-            # Add more tags as needed
-        }
+        natural_tag_colors = self.NATURAL_TAG_COLORS
         
         # Visualize merged data (if provided)
         if data is not None:
             # Check if data is a GeoDataFrame
             if hasattr(data, 'iterrows'):
-                # Process as a GeoDataFrame
-                for _, row in data.iterrows():
-                    folium.GeoJson(
-                        row["geometry"].__geo_interface__,
-                        name="Merged Data",
-                        style_function=lambda feature, color="purple": {
-                            "fillColor": "purple", "color": "purple", "weight": 1, "fillOpacity": 0.5
-                        }
-                    ).add_to(m)
+                # Process as a GeoDataFrame, all rows in a single layer
+                self._add_layer(
+                    m, data, "Merged Data",
+                    style_function=lambda feature: {
+                        "fillColor": "purple", "color": "purple", "weight": 1, "fillOpacity": 0.5
+                    }
+                )
             # Check if data is a dictionary
             elif isinstance(data, dict):
                 # Process the dictionary data
                 for feature_type, gdf in data.items():
                     if hasattr(gdf, 'to_json'):
-                        folium.GeoJson(
-                            gdf.to_json(),
-                            name=f"{feature_type.capitalize()} Data",
+                        self._add_layer(
+                            m, gdf, f"{feature_type.capitalize()} Data",
                             style_function=lambda feature: {
                                 "fillColor": "purple", "color": "purple", "weight": 1, "fillOpacity": 0.5
                             }
-                        ).add_to(m)
+                        )
 
         # Add additional datasets (if any, e.g., natural and amenity data)
         if additional_datasets:
-            for name, dataset in additional_datasets.items():
-                if name == 'Natural Features':
+            for layer_name, dataset in additional_datasets.items():
+                if layer_name == 'Natural Features':
                     # For natural features, apply tag-based color mapping with default gray
-                    folium.GeoJson(
-                        dataset.to_json(),
-                        name=name,
+                    self._add_layer(
+                        m, dataset, layer_name,
                         style_function=lambda feature: {
                             "fillColor": natural_tag_colors.get(
-                                list(feature["properties"].get("tags", {}).values())[0], 
+                                feature["properties"].get("natural"),
                                 "gray"  # Default color if the tag is not found
                             ),
                             "color": "black",
                             "weight": 1,
                             "fillOpacity": 0.5
-                        }
-                    ).add_to(m)
+                        },
+                        columns=["natural"]
+                    )
                 else:
                     # Default color for non-natural datasets (like amenities)
-                    folium.GeoJson(
-                        dataset.to_json(),
-                        name=name,
+                    self._add_layer(
+                        m, dataset, layer_name,
                         style_function=lambda feature: {
                             "fillColor": "orange", "color": "orange", "weight": 1, "fillOpacity": 0.5
                         }
-                    ).add_to(m)
+                    )
 
         folium.LayerControl().add_to(m)
         m.save(f"{name}.html")
         print(f"Map saved as {name}.html")
     
+    def write_vector_tiles(self, layers, output_dir="vector_tiles", min_zoom=12, max_zoom=16, max_workers=None):
+        """
+        Write a local Mapbox Vector Tile pyramid and a viewer page that loads the tiles lazily.
+
+        layers maps a layer name to a GeoDataFrame, e.g. {"buildings": merged, "natural": ..., "amenity": ...}.
+        Serve output_dir over HTTP (python -m http.server) and open index.html.
+        """
+        output_dir = Path(output_dir)
+        written = VectorTileWriter(output_dir).write(layers, min_zoom, max_zoom, max_workers=max_workers)
+
+        natural_colors = ["match", ["get", "natural"]]
+        for tag, color in self.NATURAL_TAG_COLORS.items():
+            natural_colors += [tag, color]
+        natural_colors.append("gray")
+        colors = {"natural": natural_colors, "amenity": "orange"}
+        style = {
+            "version": 8,
+            "sources": {
+                "satellite": {
+                    "type": "raster", "tiles": ["https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}"],
+                    "tileSize": 256, "attribution": "Google Maps",
+                },
+                "features": {"type": "vector", "tiles": ["TILE_URL"], "minzoom": min_zoom, "maxzoom": max_zoom},
+            },
+            "layers": [{"id": "satellite", "type": "raster", "source": "satellite"}] + [
+                {
+                    "id": name, "type": "fill", "source": "features", "source-layer": name,
+                    "paint": {"fill-color": colors.get(name, "purple"), "fill-opacity": 0.5, "fill-outline-color": "black"},
+                }
+                for name, gdf in layers.items() if gdf is not None and len(gdf)
+            ],
+        }
+        html = f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{output_dir.name}</title>
+<link href="https://unpkg.com/maplibre-gl@4/dist/maplibre-gl.css" rel="stylesheet">
+<script src="https://unpkg.com/maplibre-gl@4/dist/maplibre-gl.js"></script>
+<style>html, body, #map {{ margin: 0; height: 100%; }}</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+const style = {json.dumps(style)};
+style.sources.features.tiles = [location.href.replace(/[^/]*$/, "") + "{{z}}/{{x}}/{{y}}.pbf"];
+new maplibregl.Map({{container: "map", style: style, center: [{self.longitude}, {self.latitude}], zoom: {min_zoom + 2}}});
+</script>
+</body>
+</html>
+"""
+        with open(output_dir / "index.html", "w") as f:
+            f.write(html)
+        print(f"Wrote {written} vector tiles and viewer to {output_dir / 'index.html'}")
+        return output_dir / "index.html"
+
+    def _value_colors(self, values, color_by):
+        """RGB color (0-255) for every value of the color_by column."""
+        if color_by == "source":
+            mapping = self.SOURCE_COLORS
+        elif color_by == "natural":
+            mapping = self.NATURAL_TAG_COLORS
+        else:
+            # A fixed palette slot per distinct value, assigned in sorted order so colors are stable
+            palette = matplotlib.colormaps["tab20"].colors
+            mapping = {value: palette[i % len(palette)] for i, value in enumerate(sorted(set(values.dropna().astype(str))))}
+        codes, uniques = pd.factorize(values.astype("string"))
+        table = np.array([mcolors.to_rgb(mapping.get(value, "gray")) for value in uniques] + [mcolors.to_rgb("gray")])
+        return np.rint(table[codes] * 255).astype(np.uint8)
+
+    def render_png(self, layers, output_path="preview.png", width=2048, color_by="source", background="white"):
+        """
+        Rasterize footprints straight into a PNG image, without building a map.
+
+        layers is a GeoDataFrame or a {name: GeoDataFrame} mapping drawn in order. Polygons are colored
+        by their color_by column ("source", "natural" or any tag column), layers without that column
+        by their layer color. Filling is an even-odd scanline fill over all polygon edges at once, and
+        every footprint covers at least one pixel so small buildings stay visible at city scale.
+        """
+        if not isinstance(layers, dict):
+            layers = {"buildings": layers}
+        layers = {name: gdf for name, gdf in layers.items() if gdf is not None and len(gdf)}
+        if not layers:
+            print("No features to render.")
+            return None
+
+        # Flatten every layer to ring vertices with one ragged-array export, projected to Web Mercator
+        flat = {}
+        for name, gdf in layers.items():
+            geometries = VectorTileWriter.lonlat_geometries(gdf)
+            polygonal = np.flatnonzero(np.isin(shapely.get_type_id(geometries), (3, 6)) & ~shapely.is_empty(geometries))
+            if not len(polygonal):
+                continue
+            _, coords, offsets = shapely.to_ragged_array(geometries[polygonal])
+            ring_offsets, part_offsets = offsets[0], offsets[1]
+            feature_offsets = offsets[2] if len(offsets) == 3 else np.arange(len(part_offsets))
+            point_ring = np.repeat(np.arange(len(ring_offsets) - 1), np.diff(ring_offsets))
+            ring_part = np.repeat(np.arange(len(part_offsets) - 1), np.diff(part_offsets))
+            part_feature = polygonal[np.repeat(np.arange(len(feature_offsets) - 1), np.diff(feature_offsets))]
+            flat[name] = (VectorTileWriter.project(coords[:, :2]), point_ring, ring_part, part_feature)
+        if not flat:
+            print("No polygons to render.")
+            return None
+
+        # Fit the combined bounds into the image width
+        minx = min(coords[:, 0].min() for coords, *_ in flat.values())
+        miny = min(coords[:, 1].min() for coords, *_ in flat.values())
+        maxx = max(coords[:, 0].max() for coords, *_ in flat.values())
+        maxy = max(coords[:, 1].max() for coords, *_ in flat.values())
+        scale = (width - 1) / max(maxx - minx, maxy - miny, 1e-12)
+        height = int(np.ceil((maxy - miny) * scale)) + 1
+        image = np.empty((height, width, 3), dtype=np.uint8)
+        image[:] = np.rint(np.array(mcolors.to_rgb(background)) * 255).astype(np.uint8)
+        pixels = image.reshape(-1, 3)
+
+        for name, (coords, point_ring, ring_part, part_feature) in flat.items():
+            gdf = layers[name]
+            if color_by in gdf.columns:
+                colors = self._value_colors(gdf[color_by].reset_index(drop=True), color_by)
+            else:
+                colors = np.tile(np.rint(np.array(mcolors.to_rgb(self.LAYER_COLORS.get(name, "purple"))) * 255).astype(np.uint8), (len(gdf), 1))
+            points = np.column_stack([(coords[:, 0] - minx) * scale, (coords[:, 1] - miny) * scale])
+
+            # Edges between consecutive vertices of the same ring, horizontal edges never cross a row center
+            same_ring = point_ring[1:] == point_ring[:-1]
+            start, end = points[:-1][same_ring], points[1:][same_ring]
+            edge_part = ring_part[point_ring[:-1][same_ring]]
+            sloped = start[:, 1] != end[:, 1]
+            start, end, edge_part = start[sloped], end[sloped], edge_part[sloped]
+
+            # Every row whose pixel center lies in [y_low, y_high) of an edge gets one crossing
+            y_low, y_high = np.minimum(start[:, 1], end[:, 1]), np.maximum(start[:, 1], end[:, 1])
+            first_row = np.ceil(y_low - 0.5).astype(np.int64)
+            rows_per_edge = np.maximum(np.ceil(y_high - 0.5).astype(np.int64) - first_row, 0)
+            edge = np.repeat(np.arange(len(start)), rows_per_edge)
+            row = first_row[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(rows_per_edge) - rows_per_edge, rows_per_edge)
+            slope = (end[:, 0] - start[:, 0]) / (end[:, 1] - start[:, 1])
+            x = start[edge, 0] + (row + 0.5 - start[edge, 1]) * slope[edge]
+
+            # Sorted crossings pair up into filled spans per polygon and row (even-odd rule handles holes)
+            # One float key per crossing: (polygon, row) major, column minor
+            key = (edge_part[edge] * height + row) * (width + 2.0) + np.clip(x, -1.0, width + 1.0)
+            order = np.argsort(key)
+            x, row, span_part = x[order], row[order], edge_part[edge][order]
+            first_col = np.clip(np.ceil(x[0::2] - 0.5).astype(np.int64), 0, width)
+            last_col = np.clip(np.ceil(x[1::2] - 0.5).astype(np.int64), 0, width)
+            span_row, span_part = row[0::2], span_part[0::2]
+            lengths = np.maximum(last_col - first_col, 0)
+            span = np.repeat(np.arange(len(lengths)), lengths)
+            col = first_col[span] + np.arange(len(span)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            pixels[span_row[span] * width + col] = colors[part_feature[span_part[span]]]
+
+            # One pixel at the first vertex of every polygon, for footprints smaller than a pixel
+            first_vertex = points[np.searchsorted(point_ring, np.flatnonzero(np.r_[True, ring_part[1:] != ring_part[:-1]]))]
+            vertex_pixel = np.clip(np.floor(first_vertex).astype(np.int64), 0, [width - 1, height - 1])
+            pixels[vertex_pixel[:, 1] * width + vertex_pixel[:, 0]] = colors[part_feature]
+
+        # Low zlib effort, previews are written far more often than they are archived
+        mimage.imsave(output_path, image, pil_kwargs={"compress_level": 1})
+        print(f"Preview saved as {output_path}")
+        return output_path
+
     def visualize_osm_and_msft_data(self, osm_data, msft_data):
         """Visualizes OSM and Microsoft Building Footprints data on the map before merging."""
         m = folium.Map(location=[self.latitude, self.longitude], zoom_start=14, tiles="https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}", attr="Google Maps")
@@ -453,45 +1892,464 @@ class Visualizer:
             msft_data = gpd.read_file(msft_data)  # If msft_data is a file path or URL
 
         # Add OSM data to map (example: OSM data color could be blue)
-        folium.GeoJson(
-            osm_data.to_json(),
-            name="OSM Data",
+        self._add_layer(
+            m, osm_data, "OSM Data",
             style_function=lambda feature: {
                 "fillColor": "blue", "color": "blue", "weight": 1, "fillOpacity": 0.5
             }
-        ).add_to(m)
+        )
 
         # Add Microsoft Building Footprints data to map (example: MSFT data color could be green)
-        folium.GeoJson(
-            msft_data.to_json(),
-            name="Microsoft Footprints",
+        self._add_layer(
+            m, msft_data, "Microsoft Footprints",
             style_function=lambda feature: {
                 "fillColor": "green", "color": "green", "weight": 1, "fillOpacity": 0.5
             }
-        ).add_to(m)
+        )
 
         folium.LayerControl().add_to(m)
         m.save("osm_and_msft_map.html")
         print("Map with OSM and Microsoft data saved as osm_and_msft_map.html")
 
 
+class PrismExtruder:
+    """
+    Extrude footprint polygons into closed triangle meshes with NumPy and write them as binary STL.
+
+    Walls and the caps of convex footprints are built for all footprints in one go, other caps are
+    triangulated by ear clipping with holes bridged into the outer ring first. Meshes are indexed:
+    vertices (n, 3) and faces (m, 3).
+    """
+    # Binary STL record: normal, three vertices and an unused attribute word, 50 bytes
+    STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+    # Binary PLY records: double precision vertices, triangles with the id of their building
+    PLY_VERTEX = np.dtype([("xyz", "<f8", (3,))])
+    PLY_FACE = np.dtype([("count", "u1"), ("vertices", "<i4", (3,)), ("building_id", "<u4")])
+    # Rings up to this many vertices are ear clipped in batches, bigger ones one at a time
+    BATCH_CLIP_SIZE = 64
+    # Candidate/blocker pairs evaluated per batch, bounds the memory of one clipping round
+    CLIP_CHUNK_CELLS = 1 << 20
+
+    @staticmethod
+    def _cross(a, b, c):
+        """z component of (b - a) x (c - b), positive when a -> b -> c turns left."""
+        return (b[..., 0] - a[..., 0]) * (c[..., 1] - b[..., 1]) - (b[..., 1] - a[..., 1]) * (c[..., 0] - b[..., 0])
+
+    @staticmethod
+    def _bridge_hole(points, ring, hole):
+        """
+        Splice a clockwise hole into a counter-clockwise ring through a zero-width bridge.
+
+        The bridge runs from the rightmost hole vertex along the +x ray to the nearest ring edge, or to
+        a ring vertex inside that triangle with the smallest angle to the ray. Holes must be bridged in
+        descending order of their rightmost x so bridges never cross.
+        """
+        m = hole[np.argmax(points[hole, 0])]
+        mx, my = points[m]
+        a, b = points[ring], points[np.roll(ring, -1)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = a[:, 0] + (my - a[:, 1]) * (b[:, 0] - a[:, 0]) / (b[:, 1] - a[:, 1])
+        hit = (np.minimum(a[:, 1], b[:, 1]) <= my) & (my <= np.maximum(a[:, 1], b[:, 1])) & (a[:, 1] != b[:, 1]) & (x >= mx)
+        if not hit.any():
+            # Hole outside the ring (invalid input), connect it to the nearest vertex
+            position = int(np.argmin(np.hypot(a[:, 0] - mx, a[:, 1] - my)))
+        else:
+            edge = np.flatnonzero(hit)[np.argmin(x[hit])]
+            position = edge if a[edge, 0] >= b[edge, 0] else (edge + 1) % len(ring)
+            ix, px, py = x[edge], *points[ring[position]]
+            # Ring vertices inside triangle (M, I, P) would block the bridge, take the one closest to the ray
+            corners = np.array([[mx, my], [ix, my], [px, py]])
+            if PrismExtruder._cross(corners[0], corners[1], corners[2]) < 0:
+                corners = corners[::-1]
+            inside = np.ones(len(ring), dtype=bool)
+            for k in range(3):
+                inside &= PrismExtruder._cross(corners[k], corners[(k + 1) % 3], a) >= 0
+            inside &= (a[:, 0] > mx) & ((a[:, 0] != px) | (a[:, 1] != py))
+            if inside.any():
+                candidates = np.flatnonzero(inside)
+                tangent = np.abs(a[candidates, 1] - my) / (a[candidates, 0] - mx)
+                distance = np.hypot(a[candidates, 0] - mx, a[candidates, 1] - my)
+                position = int(candidates[np.lexsort((distance, tangent))[0]])
+
+        # Earlier bridges leave some ring vertices twice, attach to the copy whose wedge faces the hole
+        copies = np.flatnonzero(ring == ring[position])
+        if len(copies) > 1:
+            p, bridge_end = points[ring[copies]], np.array([mx, my])
+            prev, nxt = points[ring[copies - 1]], points[ring[(copies + 1) % len(ring)]]
+            after_next = PrismExtruder._cross(p, nxt, bridge_end)
+            before_prev = PrismExtruder._cross(p, bridge_end, prev)
+            convex = PrismExtruder._cross(p, nxt, prev) > 0
+            # Strictly inside first, a bridge along an earlier one touches two wedges on their boundary
+            strict = np.where(convex, (after_next > 0) & (before_prev > 0), (after_next > 0) | (before_prev > 0))
+            loose = np.where(convex, (after_next >= 0) & (before_prev >= 0), (after_next >= 0) | (before_prev >= 0))
+            for inside in (strict, loose):
+                if inside.any():
+                    position = int(copies[np.argmax(inside)])
+                    break
+
+        start = int(np.flatnonzero(hole == m)[0])
+        return np.concatenate([ring[:position + 1], hole[start:], hole[:start], [m, ring[position]], ring[position + 1:]])
+
+    @classmethod
+    def _ear_clip(cls, points, ring):
+        """Triangulate a weakly simple counter-clockwise ring of point indices, returns (m, 3) indices."""
+        ring = np.asarray(ring)
+        triangles = []
+        while len(ring) > 3:
+            p = points[ring]
+            prev, nxt = np.roll(p, 1, axis=0), np.roll(p, -1, axis=0)
+            turn = cls._cross(prev, p, nxt)
+
+            # A spike back to the same vertex cancels out and is dropped, other duplicates and spikes are
+            # clipped as zero-area triangles. Straight vertices stay so the caps share every wall edge,
+            # they are never clipped and block ears like reflex vertices do
+            n = len(ring)
+            returns = np.flatnonzero(np.roll(ring, 1) == np.roll(ring, -1))
+            if len(returns):
+                ring = np.delete(ring, returns[0])
+                continue
+            spikes = np.flatnonzero((turn == 0) & (np.einsum("ij,ij->i", p - prev, nxt - p) <= 0))
+
+            # An ear is a convex vertex whose triangle contains no reflex or straight vertex
+            ear = spikes[0] if len(spikes) else None
+            reflex = np.flatnonzero(turn <= 0)
+            for i in np.flatnonzero(turn > 0) if ear is None else ():
+                if len(reflex):
+                    q = p[reflex]
+                    a, b, c = prev[i], p[i], nxt[i]
+                    inside = (cls._cross(a, b, q) >= 0) & (cls._cross(b, c, q) >= 0) & (cls._cross(c, a, q) >= 0)
+                    inside &= (ring[reflex] != ring[(i - 1) % n]) & (ring[reflex] != ring[i]) & (ring[reflex] != ring[(i + 1) % n])
+                    if inside.any():
+                        continue
+                ear = i
+                break
+            if ear is None:
+                # Self-intersecting input, clip the sharpest convex (or any) vertex to guarantee progress
+                ear = int(np.argmax(turn))
+            triangles.append((ring[(ear - 1) % n], ring[ear], ring[(ear + 1) % n]))
+            ring = np.delete(ring, ear)
+        if len(ring) == 3 and cls._cross(*points[ring]) >= 0:
+            triangles.append(tuple(ring))
+        return np.array(triangles, dtype=np.int64).reshape(-1, 3)
+
+    @classmethod
+    def _ear_clip_many(cls, points, ring_vertices, ring_sizes):
+        """
+        Ear clip many small rings at once, given as consecutive runs of ring_vertices.
+
+        Rings are padded into a matrix and every round clips one ear per ring, testing all candidate
+        ears against all blocking vertices of their ring together. Returns (m, 3) indices and the
+        ring of every triangle.
+        """
+        ring_starts = np.cumsum(ring_sizes) - ring_sizes
+        triangles, owners = [], []
+        # Rings are chunked by power of two size, chunks stay at about CLIP_CHUNK_CELLS candidate/blocker pairs
+        buckets = np.ceil(np.log2(ring_sizes)).astype(np.int64)
+        chunks = []
+        for bucket in np.unique(buckets):
+            members = np.flatnonzero(buckets == bucket)
+            rows = max(cls.CLIP_CHUNK_CELLS >> (2 * bucket), 1)
+            chunks.extend(members[start:start + rows] for start in range(0, len(members), rows))
+        for chunk in chunks:
+            sizes = ring_sizes[chunk].copy()
+            rings = ring_vertices[ring_starts[chunk, None] + np.minimum(np.arange(sizes.max()), sizes[:, None] - 1)]
+            active = np.arange(len(chunk))
+            while True:
+                active = active[sizes[active] > 3]
+                if not len(active):
+                    break
+                size = sizes[active]
+                ring = rings[active, :size.max()]
+                column = np.arange(ring.shape[1])
+                valid = column < size[:, None]
+                ring_prev = np.take_along_axis(ring, (column - 1) % size[:, None], axis=1)
+                ring_next = np.take_along_axis(ring, (column + 1) % size[:, None], axis=1)
+                prev, p, nxt = points[ring_prev], points[ring], points[ring_next]
+                turn = cls._cross(prev, p, nxt)
+
+                # Same rules as _ear_clip: returning spikes are dropped, other spikes clipped first,
+                # then the first convex vertex without a reflex or straight vertex in its triangle
+                returns = valid & (ring_prev == ring_next)
+                spikes = valid & (turn == 0) & (np.einsum("rki,rki->rk", p - prev, nxt - p) <= 0)
+                ears = valid & (turn > 0)
+                blocking = valid & (turn <= 0)
+                most = blocking.sum(axis=1).max()
+                if most:
+                    # Only the blocking vertices of each ring, moved to the front, are tested
+                    front = np.argsort(~blocking, axis=1, kind="stable")[:, :most]
+                    blocker = np.take_along_axis(ring, front, axis=1)[:, None]
+                    a, b, c, q = prev[:, :, None], p[:, :, None], nxt[:, :, None], points[blocker]
+                    inside = (cls._cross(a, b, q) >= 0) & (cls._cross(b, c, q) >= 0) & (cls._cross(c, a, q) >= 0)
+                    inside &= np.take_along_axis(blocking, front, axis=1)[:, None]
+                    inside &= (blocker != ring_prev[:, :, None]) & (blocker != ring[:, :, None]) & (blocker != ring_next[:, :, None])
+                    ears &= ~inside.any(axis=2)
+                choice = np.where(valid, turn, -np.inf).argmax(axis=1)
+                for candidates in (ears, spikes, returns):
+                    choice = np.where(candidates.any(axis=1), candidates.argmax(axis=1), choice)
+
+                row = np.arange(len(active))
+                emit = ~returns.any(axis=1)
+                triangles.append(np.column_stack([ring_prev[row, choice], ring[row, choice], ring_next[row, choice]])[emit])
+                owners.append(chunk[active[emit]])
+                shift = np.minimum(column + (column >= choice[:, None]), len(column) - 1)
+                rings[active, :len(column)] = np.take_along_axis(ring, shift, axis=1)
+                sizes[active] -= 1
+
+            last = np.flatnonzero(sizes == 3)
+            final = rings[last, :3]
+            counter_clockwise = cls._cross(*points[final].transpose(1, 0, 2)) >= 0
+            triangles.append(final[counter_clockwise])
+            owners.append(chunk[last[counter_clockwise]])
+        return np.concatenate(triangles).reshape(-1, 3), np.concatenate(owners)
+
+    @classmethod
+    def _bridge_holes(cls, points, ring_offsets):
+        """Single ring of point indices for a polygon with holes, see triangulate for the layout."""
+        rings = [np.arange(start, end) for start, end in zip(ring_offsets[:-1], ring_offsets[1:])]
+        outer = rings[0]
+        for hole in sorted(rings[1:], key=lambda hole: -points[hole, 0].max()):
+            outer = cls._bridge_hole(points, outer, hole)
+        return outer
+
+    @classmethod
+    def triangulate(cls, points, ring_offsets):
+        """
+        Triangulate one polygon given as points[ring_offsets[0]:ring_offsets[-1]], exterior ring first,
+        without closing or repeated vertices. The exterior must be counter-clockwise and holes clockwise.
+
+        Returns (m, 3) indices into points.
+        """
+        return cls._ear_clip(points, cls._bridge_holes(points, ring_offsets))
+
+    @classmethod
+    def meshes(cls, footprints, heights, base=0.0):
+        """
+        Closed prism meshes of many (multi)polygon footprints at once, each from z=base to z=base+height.
+
+        Returns vertices (n, 3) float64, faces (m, 3) int64 with outward counter-clockwise winding and
+        face_offsets, so the faces of footprint i are faces[face_offsets[i]:face_offsets[i + 1]].
+        """
+        footprints = np.asarray(footprints, dtype=object)
+        heights = np.broadcast_to(np.asarray(heights, dtype=np.float64), footprints.shape)
+        parts, part_footprint = shapely.get_parts(footprints, return_index=True)
+        valid = shapely.area(parts) > 0
+        parts, part_footprint = shapely.orient_polygons(shapely.remove_repeated_points(parts[valid])), part_footprint[valid]
+        if not len(parts):
+            return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64), np.zeros(len(footprints) + 1, dtype=np.int64)
+
+        # Ring vertices without the closing vertex, exterior first, rings of a part and parts contiguous
+        _, coords, (ring_offsets, part_offsets) = shapely.to_ragged_array(parts)
+        keep = np.ones(len(coords), dtype=bool)
+        keep[ring_offsets[1:] - 1] = False
+        points = coords[keep, :2]
+        ring_offsets = ring_offsets - np.arange(len(ring_offsets))
+        n = len(points)
+        ring_sizes = np.diff(ring_offsets)
+        point_ring = np.repeat(np.arange(len(ring_sizes)), ring_sizes)
+        ring_part = np.repeat(np.arange(len(parts)), np.diff(part_offsets))
+
+        # Walls: every ring edge i -> next becomes two triangles between the bottom and top copies
+        current = np.arange(n)
+        following = current + 1
+        following[ring_offsets[1:] - 1] = ring_offsets[:-1]
+        preceding = np.empty_like(following)
+        preceding[following] = current
+        walls = np.concatenate([
+            np.column_stack([current, following, following + n]),
+            np.column_stack([current, following + n, current + n]),
+        ])
+        wall_part = np.tile(ring_part[point_ring], 2)
+
+        # Caps: convex parts without holes are fanned in bulk
+        turn = cls._cross(points[preceding], points, points[following])
+        convex = (np.diff(part_offsets) == 1) & (np.minimum.reduceat(turn, ring_offsets[part_offsets[:-1]]) >= 0)
+        fan_rings = part_offsets[:-1][convex]
+        fan_sizes = ring_sizes[fan_rings] - 2
+        fan_part = np.repeat(np.flatnonzero(convex), fan_sizes)
+        fan_start = np.repeat(ring_offsets[fan_rings], fan_sizes)
+        step = np.arange(len(fan_part)) - np.repeat(np.cumsum(fan_sizes) - fan_sizes, fan_sizes) + 1
+        caps, cap_part = [np.column_stack([fan_start, fan_start + step, fan_start + step + 1])], [fan_part]
+
+        # Concave parts become one ring each, holes bridged in, small rings are clipped together
+        concave = np.flatnonzero(~convex)
+        holed = np.diff(part_offsets)[concave] > 1
+        simple = concave[~holed]
+        simple_starts, simple_sizes = ring_offsets[part_offsets[simple]], ring_sizes[part_offsets[simple]]
+        bridged = [cls._bridge_holes(points, ring_offsets[part_offsets[part]:part_offsets[part + 1] + 1]) for part in concave[holed]]
+        clip_part = np.r_[simple, concave[holed]].astype(np.int64)
+        clip_sizes = np.r_[simple_sizes, [len(ring) for ring in bridged]].astype(np.int64)
+        clip_vertices = np.concatenate([
+            np.arange(simple_sizes.sum()) + np.repeat(simple_starts - (np.cumsum(simple_sizes) - simple_sizes), simple_sizes),
+            *bridged,
+        ]).astype(np.int64)
+        small = clip_sizes <= cls.BATCH_CLIP_SIZE
+        if small.any():
+            in_small = np.repeat(small, clip_sizes)
+            triangles, owner = cls._ear_clip_many(points, clip_vertices[in_small], clip_sizes[small])
+            caps.append(triangles)
+            cap_part.append(clip_part[small][owner])
+        clip_starts = np.cumsum(clip_sizes) - clip_sizes
+        for ring in np.flatnonzero(~small):
+            triangles = cls._ear_clip(points, clip_vertices[clip_starts[ring]:clip_starts[ring] + clip_sizes[ring]])
+            caps.append(triangles)
+            cap_part.append(np.full(len(triangles), clip_part[ring]))
+        caps, cap_part = np.concatenate(caps).astype(np.int64), np.concatenate(cap_part)
+
+        # Bottom copies of the points at base, top copies at base + height of their footprint
+        point_height = heights[part_footprint[ring_part[point_ring]]]
+        vertices = np.column_stack([np.tile(points, (2, 1)), np.r_[np.full(n, base, dtype=np.float64), base + point_height]])
+        faces = np.concatenate([caps[:, ::-1], caps + n, walls])
+        face_footprint = part_footprint[np.r_[cap_part, cap_part, wall_part]]
+        order = np.argsort(face_footprint, kind="stable")
+        face_offsets = np.searchsorted(face_footprint[order], np.arange(len(footprints) + 1))
+        return vertices, faces[order], face_offsets
+
+    @classmethod
+    def mesh(cls, footprint, height, base=0.0):
+        """Closed prism mesh of one (multi)polygon footprint, see meshes."""
+        vertices, faces, _ = cls.meshes([footprint], [height], base)
+        return vertices, faces
+
+    @staticmethod
+    def _normals(triangles):
+        """Unit normal of every (m, 3, 3) triangle, zero for degenerate ones."""
+        normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+    @classmethod
+    def write_stl(cls, path, vertices, faces, face_ids=None):
+        """
+        Write an indexed triangle mesh as binary STL with per-face normals.
+
+        face_ids are stored in the 16-bit attribute word of every triangle when they fit in it.
+        """
+        buffer = np.zeros(84 + cls.STL_RECORD.itemsize * len(faces), dtype=np.uint8)
+        buffer[:84] = np.frombuffer(b"Binary STL written by GeoForge3D".ljust(80, b" ") + struct.pack("<I", len(faces)), dtype=np.uint8)
+        records = buffer[84:].view(cls.STL_RECORD)
+        triangles = vertices[faces]
+        records["normal"] = cls._normals(triangles)
+        records["vertices"] = triangles
+        if face_ids is not None:
+            if len(face_ids) and face_ids.max() > 0xFFFF:
+                print("Building ids above 65535 do not fit the STL attribute word, write PLY or GLB to keep them.")
+            else:
+                records["attribute"] = face_ids
+        with open(path, "wb") as f:
+            f.write(buffer)
+
+    @classmethod
+    def write_ply(cls, path, vertices, faces, face_ids):
+        """Write an indexed triangle mesh as binary PLY with double precision vertices and a building_id per face."""
+        header = (
+            "ply\nformat binary_little_endian 1.0\ncomment written by GeoForge3D\n"
+            f"element vertex {len(vertices)}\nproperty double x\nproperty double y\nproperty double z\n"
+            f"element face {len(faces)}\nproperty list uchar int vertex_indices\nproperty uint building_id\nend_header\n"
+        ).encode("ascii")
+        vertex_end = len(header) + cls.PLY_VERTEX.itemsize * len(vertices)
+        buffer = np.empty(vertex_end + cls.PLY_FACE.itemsize * len(faces), dtype=np.uint8)
+        buffer[:len(header)] = np.frombuffer(header, dtype=np.uint8)
+        buffer[len(header):vertex_end].view(cls.PLY_VERTEX)["xyz"] = vertices
+        records = buffer[vertex_end:].view(cls.PLY_FACE)
+        records["count"] = 3
+        records["vertices"] = faces
+        records["building_id"] = face_ids
+        with open(path, "wb") as f:
+            f.write(buffer)
+
+    @classmethod
+    def write_glb(cls, path, vertices, faces, face_ids):
+        """
+        Write an indexed triangle mesh as binary glTF with a _BUILDING_ID vertex attribute.
+
+        Positions are stored as float32 relative to the mesh's minimum corner, which becomes the node
+        translation, so projected coordinates keep centimetre precision. A parent node turns the
+        Z-up model into glTF's Y-up frame. glTF does not allow unsigned int custom attributes, so
+        building ids are stored as float32, which is exact below 2^24.
+        """
+        origin = vertices.min(axis=0)
+        face_ids = np.asarray(face_ids)
+        if len(face_ids) and face_ids.max() >= 1 << 24:
+            raise ValueError("glTF building ids must be below 2^24 to stay exact as float32")
+        vertex_ids = np.zeros(len(vertices), dtype=np.float32)
+        vertex_ids[faces] = face_ids[:, None]
+
+        # Binary chunk: positions, building ids, indices, every view 4-byte aligned
+        views = [("positions", 12 * len(vertices), 34962), ("ids", 4 * len(vertices), 34962), ("indices", 12 * len(faces), 34963)]
+        offsets = np.cumsum([0] + [length for _, length, _ in views])
+        positions_min = (vertices - origin).min(axis=0).astype(np.float32)
+        positions_max = (vertices - origin).max(axis=0).astype(np.float32)
+        document = {
+            "asset": {"version": "2.0", "generator": "GeoForge3D"},
+            "scene": 0,
+            "scenes": [{"nodes": [0]}],
+            "nodes": [
+                {"name": "z_up", "rotation": [-math.sqrt(0.5), 0.0, 0.0, math.sqrt(0.5)], "children": [1]},
+                {"name": "buildings", "mesh": 0, "translation": origin.tolist()},
+            ],
+            "meshes": [{"primitives": [{"attributes": {"POSITION": 0, "_BUILDING_ID": 1}, "indices": 2, "mode": 4}]}],
+            "accessors": [
+                {"bufferView": 0, "componentType": 5126, "count": len(vertices), "type": "VEC3",
+                 "min": positions_min.tolist(), "max": positions_max.tolist()},
+                {"bufferView": 1, "componentType": 5126, "count": len(vertices), "type": "SCALAR"},
+                {"bufferView": 2, "componentType": 5125, "count": 3 * len(faces), "type": "SCALAR"},
+            ],
+            "bufferViews": [
+                {"buffer": 0, "byteOffset": int(offset), "byteLength": length, "target": target}
+                for offset, (_, length, target) in zip(offsets, views)
+            ],
+            "buffers": [{"byteLength": int(offsets[-1])}],
+        }
+        content = json.dumps(document, separators=(",", ":")).encode("utf-8")
+        content += b" " * (-len(content) % 4)
+
+        binary_start = 12 + 8 + len(content) + 8
+        buffer = np.empty(binary_start + offsets[-1], dtype=np.uint8)
+        buffer[:20] = np.frombuffer(struct.pack("<4sII", b"glTF", 2, len(buffer)) + struct.pack("<I4s", len(content), b"JSON"), dtype=np.uint8)
+        buffer[20:20 + len(content)] = np.frombuffer(content, dtype=np.uint8)
+        buffer[binary_start - 8:binary_start] = np.frombuffer(struct.pack("<I4s", int(offsets[-1]), b"BIN\0"), dtype=np.uint8)
+        binary = buffer[binary_start:]
+        np.subtract(vertices, origin, out=binary[offsets[0]:offsets[1]].view("<f4").reshape(-1, 3), casting="same_kind")
+        binary[offsets[1]:offsets[2]].view("<f4")[:] = vertex_ids
+        binary[offsets[2]:offsets[3]].view("<u4")[:] = faces.ravel()
+        with open(path, "wb") as f:
+            f.write(buffer)
+
+    @classmethod
+    def write_mesh(cls, path, vertices, faces, face_ids):
+        """Write one mesh in the format given by the path's suffix: .stl, .ply or .glb."""
+        writers = {".stl": cls.write_stl, ".ply": cls.write_ply, ".glb": cls.write_glb}
+        suffix = Path(path).suffix.lower()
+        if suffix not in writers:
+            raise ValueError(f"Unknown mesh format '{suffix}', expected one of {tuple(writers)}")
+        writers[suffix](path, vertices, faces, face_ids)
+
+
 class GeoJSONToCADConverter:
-    def __init__(self, geojson_path: str, buildings_geojson_path: str, default_height: float = 5.0, extrude_height: float = 0.0):
+    # Storey height in metres used when a building only has a building:levels tag
+    LEVEL_HEIGHT = 3.0
+
+    def __init__(self, geojson_path: str, buildings_geojson_path: str = None, default_height: float = 5.0, extrude_height: float = 0.0,
+                 bbox: Tuple[float, float, float, float] = None, buildings: gpd.GeoDataFrame = None):
         """
         Initialize the converter with a GeoJSON file path and default height.
         
         :param geojson_path:: Path to the input GeoJSON file
-        :param buildings_geojson_path: Path to the buildings GeoJSON file
+        :param buildings_geojson_path: Path to the buildings file (GeoParquet, FlatGeobuf or GeoJSON)
         :param default_height: Height to use when no height is specified (default 5.0)
+        :param bbox: Only convert buildings intersecting this (minx, miny, maxx, maxy) bbox
+        :param buildings: Buildings GeoDataFrame handed over in memory, used instead of buildings_geojson_path
         """
         self.default_height = default_height
         self.extrude_height = extrude_height
         self.geojson_path = geojson_path
         self.buildings_geojson_path = buildings_geojson_path
         
-        # Read the GeoJSON file
-        with open(buildings_geojson_path, 'r') as f:
-            self.geojson_data = json.load(f)
+        # Take the buildings from the previous stage or read them, only the ones inside bbox if given
+        if buildings is not None:
+            self.buildings = buildings if bbox is None else buildings.iloc[np.sort(buildings.sindex.query(box(*bbox)))]
+        else:
+            self.buildings = GeoFileIO.read(buildings_geojson_path, bbox=bbox)
         
         # Create output directory if it doesn't exist
         self.output_dir = Path('building_models')
@@ -515,29 +2373,67 @@ class GeoJSONToCADConverter:
     #     """ Convert longitude and latitude to meters using UTM projection. """
     #     return self.transformer.transform(lon, lat)
 
-    def _convert_coordinates(self, lon: float, lat: float) -> Tuple[float, float]:
-        """Convert longitude and latitude to meters using UTM projection."""
-        # Determine UTM zone number based on longitude
-        zone_number = int((lon + 180) / 6) + 1
-        
-        # Determine if northern or southern hemisphere
-        north_south = 6 if lat >= 0 else 7
-        
-        # Create the EPSG code for this UTM zone
-        # Format: 32[6/7]xx where xx is the zone number and 6=north, 7=south
-        epsg_code = f"32{north_south}{zone_number:02d}"
-        
-        # Create transformer from WGS84 to UTM
-        transformer = Transformer.from_crs("EPSG:4326", f"EPSG:{epsg_code}", always_xy=True)
-        
-        # Transform the coordinates
-        x, y = transformer.transform(lon, lat)
+    # One WGS84 -> UTM transformer per EPSG code, shared by every converter
+    _transformers = {}
+
+    @classmethod
+    def _transformer(cls, epsg_code: int) -> Transformer:
+        """ Cached transformer from WGS84 to the given UTM EPSG code. """
+        if epsg_code not in cls._transformers:
+            cls._transformers[epsg_code] = Transformer.from_crs("EPSG:4326", f"EPSG:{epsg_code}", always_xy=True)
+        return cls._transformers[epsg_code]
+
+    @staticmethod
+    def _utm_epsg(lon, lat):
+        """
+        UTM EPSG code for longitude/latitude arrays.
+
+        Format: 32[6/7]xx where xx is the zone number and 6=north, 7=south
+        """
+        zone_number = np.clip(((np.asarray(lon) + 180) // 6).astype(np.int64) + 1, 1, 60)
+        return np.where(np.asarray(lat) >= 0, 32600, 32700) + zone_number
+
+    def _convert_coordinates(self, lon, lat) -> Tuple[np.ndarray, np.ndarray]:
+        """Convert longitude and latitude arrays to meters using UTM projection, one transform per zone."""
+        lon, lat = np.atleast_1d(np.asarray(lon, dtype=np.float64)), np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        epsg_codes = self._utm_epsg(lon, lat)
+        x, y = np.empty_like(lon), np.empty_like(lat)
+        for epsg_code in np.unique(epsg_codes):
+            in_zone = epsg_codes == epsg_code
+            x[in_zone], y[in_zone] = self._transformer(int(epsg_code)).transform(lon[in_zone], lat[in_zone])
         return x, y
-        
-    def _extract_coordinates(self, feature: dict) -> List[Tuple[float, float]]:
-        """ Extract and convert 2D coordinates from a GeoJSON feature. """
-        orig_coords = feature['geometry']['coordinates'][0]
-        return [self._convert_coordinates(lon, lat) for lon, lat in orig_coords]
+
+    def _project_geometries(self, geometries) -> np.ndarray:
+        """
+        Project all building footprints to UTM in bulk.
+
+        Every vertex is gathered into one flat array and each building uses the zone of its first
+        vertex, so footprints straddling a zone border are not split across two projections.
+        """
+        geometries = np.array(geometries, dtype=object)
+        coords, index = shapely.get_coordinates(geometries, return_index=True)
+        if not len(coords):
+            return geometries
+        # Vertices are grouped by building, so a building starts wherever its index changes
+        first = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        building_codes = self._utm_epsg(coords[first, 0], coords[first, 1])
+        zones = np.unique(building_codes)
+        if len(zones) == 1:
+            x, y = self._transformer(int(zones[0])).transform(coords[:, 0], coords[:, 1])
+            return shapely.set_coordinates(geometries, np.column_stack([x, y]))
+
+        epsg_codes = np.repeat(building_codes, np.diff(np.r_[first, len(index)]))
+        projected = np.empty_like(coords)
+        for epsg_code in zones:
+            in_zone = epsg_codes == epsg_code
+            projected[in_zone, 0], projected[in_zone, 1] = self._transformer(int(epsg_code)).transform(coords[in_zone, 0], coords[in_zone, 1])
+        return shapely.set_coordinates(geometries, projected)
+
+    def _extract_coordinates(self, geometry: Polygon) -> List[Tuple[float, float]]:
+        """ Extract and convert 2D exterior coordinates of a building polygon. """
+        orig_coords = np.asarray(geometry.exterior.coords)
+        x, y = self._convert_coordinates(orig_coords[:, 0], orig_coords[:, 1])
+        return list(zip(x.tolist(), y.tolist()))
     
     # def _get_height(self, feature: dict) -> float:
     #     """ Get height for a feature, using default if not specified. """
@@ -550,54 +2446,240 @@ class GeoJSONToCADConverter:
     #     return float(tags.get('height', self.default_height)) + self.extrude_height
 
 
-    def _get_height(self, feature: dict) -> float:
-        """ Get height for a feature, using default if not specified. """
-        tags = feature['properties'].get('tags', {})
-        
-        # If tags dictionary is empty, use the height from properties
-        if tags is None:
-            height = feature['properties']['properties']['height']
-            
-            if height > 0:
-                height = height + self.extrude_height
+    def _get_heights(self, buildings: gpd.GeoDataFrame) -> np.ndarray:
+        """
+        Extrusion height of every building from the typed height and levels columns.
+
+        Falls back from the height column to levels * LEVEL_HEIGHT, then to the default height.
+        """
+        properties = buildings.reindex(columns=['height', 'levels'])
+        height = pd.to_numeric(properties['height'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        levels = pd.to_numeric(properties['levels'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        height = np.where(height > 0, height, levels * self.LEVEL_HEIGHT)
+        height = np.where(height > 0, height, self.default_height)
+        return height + self.extrude_height
+
+    # File suffix of every supported output format
+    MODEL_SUFFIXES = {'STEP': 'step', 'STL': 'stl'}
+    # Failed buildings listed in the conversion summary, the returned summary has all of them
+    REPORTED_FAILURES = 20
+    # Part of every model's content hash, bump it when the models change for the same input
+    MODEL_VERSION = 1
+
+    def convert_to_step(self, max_workers=None, chunk_size=None, incremental=True):
+        """ Convert building footprints to STEP files using CadQuery, see convert. """
+        return self.convert('STEP', max_workers=max_workers, chunk_size=chunk_size, incremental=incremental)
+    
+    def convert_to_stl(self, max_workers=None, chunk_size=None, incremental=True):
+        """ Convert building footprints to binary STL files with the NumPy prism extruder, see convert. """
+        return self.convert('STL', max_workers=max_workers, chunk_size=chunk_size, incremental=incremental)
+
+    def _feature_hashes(self, footprints, heights, file_format):
+        """ Content hash of every building: projected footprint, height, extrude setting and output format. """
+        settings = f"{file_format}:{self.MODEL_VERSION}:{self.extrude_height!r}:".encode('utf-8')
+        return [
+            hashlib.sha1(settings + struct.pack('<d', height) + (wkb or b'')).hexdigest()
+            for wkb, height in zip(shapely.to_wkb(footprints), heights)
+        ]
+
+    @staticmethod
+    def _load_manifest(directory):
+        """ Manifest of the models in directory: {"files": {file name: content hash}}. """
+        manifest_path = Path(directory) / 'manifest.json'
+        if manifest_path.exists():
+            with open(manifest_path, 'r') as f:
+                return json.load(f)
+        return {'files': {}}
+
+    @staticmethod
+    def _save_manifest(directory, manifest):
+        """ Write the manifest next to the models it describes. """
+        manifest_path = Path(directory) / 'manifest.json'
+        tmp_manifest = manifest_path.with_suffix('.json.tmp')
+        with open(tmp_manifest, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_manifest, manifest_path)
+
+    def convert(self, file_format='STL', max_workers=None, chunk_size=None, incremental=True):
+        """
+        Convert building footprints to one model file per building in a process pool.
+
+        Footprints are projected and their heights resolved up front, then sent to the workers in
+        chunks of chunk_size buildings (by default about four chunks per worker). Files are always
+        named building_<row>.<suffix> after the building's row, whatever order chunks finish in.
+        A failing building is reported and does not stop the others. max_workers=1 converts in
+        this process. Returns a summary dict with the written paths and the failures per building.
+
+        With incremental=True only new or changed buildings are converted. manifest.json in the
+        output directory records a content hash per file, models whose building moved to another
+        row are renamed instead of rebuilt, and models of buildings that are gone are removed.
+        """
+        suffix = self.MODEL_SUFFIXES[file_format]
+        heights = self._get_heights(self.buildings)
+        footprints = self._project_geometries(self.buildings.geometry)
+        selected = np.ones(len(footprints), dtype=bool)
+        if file_format == 'STEP':
+            # Only features tagged as buildings are converted to STEP
+            selected = self.buildings.reindex(columns=['building'])['building'].notna().to_numpy()
+        features = [
+            (idx, footprint, height, os.path.join(self.output_dir, f'building_{idx}.{suffix}'))
+            for idx, footprint, height, keep in zip(range(1, len(footprints) + 1), footprints, heights, selected) if keep
+        ]
+        hashes = dict(zip(range(1, len(footprints) + 1), self._feature_hashes(footprints, heights, file_format)))
+
+        # Match the buildings against the models on disk, tracked or left by an earlier run
+        manifest = self._load_manifest(self.output_dir)
+        recorded = manifest['files'] if incremental else {}
+        on_disk = {path.name for path in Path(self.output_dir).glob(f'building_*.{suffix}') if re.fullmatch(rf'building_\d+\.{suffix}', path.name)}
+        unchanged = {
+            idx for idx, _, _, path in features
+            if recorded.get(os.path.basename(path)) == hashes[idx] and os.path.basename(path) in on_disk
+        }
+        kept = {os.path.basename(path) for idx, _, _, path in features if idx in unchanged}
+        reusable = {recorded[name]: name for name in sorted(on_disk - kept) if name in recorded}
+        moves, pending = {}, []
+        for feature in features:
+            idx, path = feature[0], feature[3]
+            if idx in unchanged:
+                continue
+            if hashes[idx] in reusable:
+                moves[os.path.basename(path)] = reusable.pop(hashes[idx])
             else:
-                height = self.default_height + self.extrude_height
+                pending.append(feature)
+
+        # Park reused models under temporary names, remove everything stale, then put them in place
+        for source in moves.values():
+            os.replace(self.output_dir / source, self.output_dir / f'{source}.move')
+        stale = on_disk - kept - set(moves.values())
+        for name in stale:
+            os.remove(self.output_dir / name)
+        for target, source in moves.items():
+            os.replace(self.output_dir / f'{source}.move', self.output_dir / target)
+        removed = len(stale - {os.path.basename(path) for _, _, _, path in features})
+        features = pending
+
+        workers = max_workers or os.cpu_count() or 1
+        chunk_size = chunk_size or max(math.ceil(len(features) / (4 * workers)), 1)
+        chunks = [features[start:start + chunk_size] for start in range(0, len(features), chunk_size)]
+        start_time = time.time()
+        results = []
+        progress = tqdm(total=len(features), desc=f"Converting buildings to {file_format}")
+        if workers == 1:
+            for chunk in chunks:
+                results.extend(self._convert_chunk(file_format, chunk))
+                progress.update(len(chunk))
         else:
-            height = float(tags.get('height', self.default_height)) + self.extrude_height
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(self._convert_chunk, file_format, chunk): chunk for chunk in chunks}
+                for future in as_completed(futures):
+                    chunk = futures[future]
+                    try:
+                        results.extend(future.result())
+                    except Exception as e:
+                        # The worker itself died, every building of the chunk failed
+                        results.extend((idx, path, f"{type(e).__name__}: {e}") for idx, _, _, path in chunk)
+                    progress.update(len(chunk))
+        progress.close()
+
+        results.sort()
+        written = [path for _, path, error in results if error is None]
+        failed = {idx: error for idx, _, error in results if error is not None}
+
+        # Record every model now on disk, models that failed to build are not recorded
+        files = {name: digest for name, digest in manifest['files'].items() if not re.fullmatch(rf'building_\d+\.{suffix}', name)}
+        for idx in sorted(unchanged) + [idx for idx, _, error in results if error is None]:
+            files[f'building_{idx}.{suffix}'] = hashes[idx]
+        for target, source in moves.items():
+            files[target] = recorded[source]
+        manifest['files'] = files
+        self._save_manifest(self.output_dir, manifest)
+
+        skipped = int(len(footprints) - selected.sum())
+        print(f"{file_format} conversion finished in {time.time() - start_time:.1f} s with {workers} worker(s): "
+              f"{len(written)} written, {len(unchanged)} unchanged, {len(moves)} renamed, {removed} removed, "
+              f"{len(failed)} failed, {skipped} skipped")
+        for idx, error in list(failed.items())[:self.REPORTED_FAILURES]:
+            print(f"  building_{idx}: {error}")
+        if len(failed) > self.REPORTED_FAILURES:
+            print(f"  ... and {len(failed) - self.REPORTED_FAILURES} more, see the returned summary")
+        return {
+            'written': written, 'failed': failed, 'skipped': skipped,
+            'unchanged': len(unchanged), 'renamed': len(moves), 'removed': removed,
+        }
+
+    def _merged_mesh(self, footprints=None, heights=None):
+        """ Prism meshes of all buildings with the row number of its building for every face. """
+        heights = self._get_heights(self.buildings) if heights is None else heights
+        footprints = self._project_geometries(self.buildings.geometry) if footprints is None else footprints
+        vertices, faces, face_offsets = PrismExtruder.meshes(footprints, heights)
+        face_ids = np.repeat(np.arange(1, len(footprints) + 1, dtype=np.uint32), np.diff(face_offsets))
+        return vertices, faces, face_ids
+
+    def convert_to_mesh(self, output_path=None, incremental=True):
+        """
+        Write all buildings into one indexed mesh file instead of one file per building.
+
+        The format follows the suffix of output_path: .stl, .ply or .glb (default building_models/buildings.glb).
+        Every face carries the row number of its building, the number used in building_<row> file names.
+        With incremental=True the mesh is only rebuilt when a building hash in it changed, see convert.
+        """
+        output_path = Path(output_path or self.output_dir / 'buildings.glb')
+        heights = self._get_heights(self.buildings)
+        footprints = self._project_geometries(self.buildings.geometry)
+        digest = hashlib.sha1("".join(self._feature_hashes(footprints, heights, output_path.suffix)).encode('utf-8')).hexdigest()
+        manifest = self._load_manifest(output_path.parent)
+        if incremental and manifest['files'].get(output_path.name) == digest and output_path.exists():
+            print(f"Merged mesh is up to date: {output_path}")
+            return output_path
+        
+        vertices, faces, face_ids = self._merged_mesh(footprints, heights)
+        if not len(faces):
+            print("No buildings to write.")
+            return None
         
-        # Return default height as last resort
-        return height
+        PrismExtruder.write_mesh(output_path, vertices, faces, face_ids)
+        manifest['files'][output_path.name] = digest
+        self._save_manifest(output_path.parent, manifest)
+        print(f"Generated merged mesh with {len(np.unique(face_ids))} buildings and {len(faces)} triangles: {output_path}")
+        return output_path
+
+    @classmethod
+    def _convert_chunk(cls, file_format, chunk):
+        """ Convert a chunk of (idx, footprint, height, path) features, returns (idx, path, error or None) per feature. """
+        meshed = None
+        if file_format == 'STL':
+            # Mesh the whole chunk at once, if a building breaks that every building is meshed on its own
+            try:
+                meshed = PrismExtruder.meshes([footprint for _, footprint, _, _ in chunk], [height for _, _, height, _ in chunk])
+            except Exception:
+                pass
 
-    def convert_to_step(self):
-        """ Convert GeoJSON features to STEP files using CadQuery. """
-        for idx, feature in enumerate(self.geojson_data.get('features', []), 1):
-            if feature['properties'].get('tags', {}).get('building') is None:
-                continue
-            
-            coords = self._extract_coordinates(feature)
-            height = self._get_height(feature)
-            
-            poly = Polygon(coords)
-            step_filename = os.path.join(self.output_dir, f'building_{idx}.step')
-            self._create_3d_model(poly, height, step_filename, file_format='STEP')
-            print(f"Generated STEP file for building {idx}: {step_filename}")
-    
-    def convert_to_stl(self):
-        """ Convert GeoJSON features to STL files using CadQuery. """
-        for idx, feature in enumerate(self.geojson_data.get('features', []), 1):
-            # if feature['properties'].get('tags', {}).get('building') is None:
-            #     continue
-            
-            coords = self._extract_coordinates(feature)
-            height = self._get_height(feature)
-            
-            poly = Polygon(coords)
-            stl_filename = os.path.join(self.output_dir, f'building_{idx}.stl')
-            self._create_3d_model(poly, height, stl_filename, file_format='STL')
-            print(f"Generated STL file for building {idx}: {stl_filename}")
+        results = []
+        for position, (idx, footprint, height, path) in enumerate(chunk):
+            try:
+                if file_format == 'STL':
+                    if meshed is not None:
+                        vertices, faces, face_offsets = meshed
+                        building_faces = faces[face_offsets[position]:face_offsets[position + 1]]
+                    else:
+                        vertices, building_faces = PrismExtruder.mesh(footprint, height)
+                    if not len(building_faces):
+                        raise ValueError("empty footprint")
+                    PrismExtruder.write_stl(path, vertices, building_faces)
+                else:
+                    cls._create_3d_model(Polygon(footprint.exterior), height, path, file_format=file_format)
+                results.append((idx, path, None))
+            except Exception as e:
+                results.append((idx, path, f"{type(e).__name__}: {e}"))
+        return results
     
-    def _create_3d_model(self, polygon: Polygon, height: float, output_path: str, file_format: str):
-        """ Generate a 3D model file (STEP or STL) from a polygon and height using CadQuery. """
+    @staticmethod
+    def _create_3d_model(polygon: Polygon, height: float, output_path: str, file_format: str):
+        """ Generate a 3D model file from a polygon and height, STL with the NumPy extruder and STEP using CadQuery. """
+        if file_format == 'STL':
+            PrismExtruder.write_stl(output_path, *PrismExtruder.mesh(polygon, height))
+            return
+        
         polygon = orient(polygon, sign=1.0)
         base_points = np.array(polygon.exterior.coords)
         
@@ -607,8 +2689,6 @@ class GeoJSONToCADConverter:
         # Export to specified file format
         if file_format == 'STEP':
             cq.exporters.export(workplane, output_path)
-        elif file_format == 'STL':
-            cq.exporters.export(workplane, output_path, exportType='STL')
 
 
 class MoveCADToTerrain(GeoJSONToCADConverter):
@@ -719,4 +2799,101 @@ class MoveCADToTerrain(GeoJSONToCADConverter):
                 translated_mesh.save(str(output_path))
                 print(f"Placed building saved as {output_path}")
             
-            return print("All buildings placed on terrain successfully.")
\ No newline at end of file
+            return print("All buildings placed on terrain successfully.")
+
+    def move_mesh_to_terrain(self, output_path=None):
+        """
+        Place all buildings on the terrain and write them into one merged mesh, see convert_to_mesh.
+
+        Buildings are moved like in move_cad_to_terrain, by the terrain height under the centre of
+        their base, but straight from the footprints instead of one STL file per building.
+        """
+        if self.terrain_path is None:
+            print("No terrain file found.")
+            return False
+        
+        print(f"Using terrain file: {self.terrain_path}")
+        terrain_mesh = pv.read(self.terrain_path)
+        vertices, faces, face_ids = self._merged_mesh()
+        if not len(faces):
+            print("No buildings to place.")
+            return False
+        
+        # Base centre of every building from the bounds of its vertices
+        vertex_ids = np.zeros(len(vertices), dtype=np.uint32)
+        vertex_ids[faces] = face_ids[:, None]
+        order = np.argsort(vertex_ids, kind="stable")
+        sorted_ids = vertex_ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+        lower = np.minimum.reduceat(vertices[order], starts)
+        upper = np.maximum.reduceat(vertices[order], starts)
+        
+        shift = np.zeros(sorted_ids[-1] + 1)
+        for building_id, (x_min, y_min, base_z), (x_max, y_max, _) in zip(sorted_ids[starts], lower, upper):
+            terrain_z = self.find_terrain_height_at_point(terrain_mesh, (x_min + x_max) / 2, (y_min + y_max) / 2)
+            shift[building_id] = terrain_z - base_z - self.extrude_height
+        vertices[:, 2] += shift[vertex_ids]
+        
+        output_path = Path(output_path or self.output_dir / 'buildings.glb')
+        PrismExtruder.write_mesh(output_path, vertices, faces, face_ids)
+        print(f"Placed {len(starts)} buildings on terrain in one mesh: {output_path}")
+        return output_path
+
+class BuildingPipeline:
+    def __init__(self, geojson_path, cache_dir="cache", persist=True, file_format="parquet", dedup_mode="intersects", max_workers=4,
+                 osm_workers=None):
+        """
+        Building pipeline that hands each stage's GeoDataFrame straight to the next one.
+
+        Nothing is read back from disk between stages. With persist=True the intermediate files
+        are still written, but on a background thread, so the next stage does not wait for them.
+        The Microsoft AOI cache file is always written because later runs reuse it. max_workers
+        threads download Microsoft footprints, osm_workers query Overpass and default to its slot
+        count per IP.
+        """
+        self.geojson_path = geojson_path
+        self.persist = persist
+        self.writer = BackgroundWriter()
+        self.osm_fetcher = OSMDataFetcherGeoJSON(geojson_path=geojson_path, cache_dir=cache_dir, max_workers=osm_workers, file_format=file_format)
+        self.msft_fetcher = MicrosoftBuildingFootprints(self.osm_fetcher.aoi_polygon, cache_dir=cache_dir, max_workers=max_workers, file_format=file_format)
+        self.data_merger = DataMerger(cache_dir=cache_dir, dedup_mode=dedup_mode, file_format=file_format)
+
+        self.osm_data = None
+        self.msft_data = None
+        self.merged_data = None
+
+    def fetch_osm(self):
+        """Stage 1: fetch the OSM building, amenity and natural layers."""
+        self.osm_data = self.osm_fetcher.fetch_osm_data(persist=self.persist, writer=self.writer) or {}
+        return self.osm_data
+
+    def fetch_microsoft(self):
+        """Stage 2: download (or load) the Microsoft footprints inside the AOI."""
+        self.msft_data, _ = self.msft_fetcher.download_microsoft_building_footprints(writer=self.writer)
+        return self.msft_data
+
+    def merge(self):
+        """Stage 3: merge the OSM buildings and Microsoft footprints in memory."""
+        osm_buildings = self.osm_data.get("building") if self.osm_data else None
+        if osm_buildings is None:
+            osm_buildings = gpd.GeoDataFrame(geometry=gpd.GeoSeries([], crs="EPSG:4326"))
+        self.merged_data = self.data_merger.merge(osm_buildings, self.msft_data)
+        if self.persist:
+            self.data_merger.save_merged(self.merged_data, writer=self.writer)
+        return self.merged_data
+
+    def visualize(self, name="merged_and_additional_data_map"):
+        """Render the OSM layers on a Folium map."""
+        visualizer = Visualizer(self.osm_fetcher.latitude, self.osm_fetcher.longitude)
+        visualizer.visualize_data(data=self.osm_data, name=name)
+
+    def converter(self, default_height=5.0, extrude_height=0.0):
+        """Stage 4: a CAD converter fed with the merged buildings inside the AOI bounds."""
+        return GeoJSONToCADConverter(
+            geojson_path=self.geojson_path, default_height=default_height, extrude_height=extrude_height,
+            bbox=self.osm_fetcher.aoi_polygon.bounds, buildings=self.merged_data
+        )
+
+    def close(self):
+        """Wait until every background write has finished."""
+        self.writer.close()
@@ -1,48 +1,48 @@
-from MapDataFetcher import OSMDataFetcherGeoJSON, MicrosoftBuildingFootprints, DataMerger, Visualizer, GeoJSONToCADConverter, MoveCADToTerrain
+from MapDataFetcher import BuildingPipeline, MoveCADToTerrain
 import sys
 import os
 
 
-# Get the GeoJSON path from command-line argument if provided
-if len(sys.argv) > 1:
-    geojson_path = sys.argv[1]
-else:
-    # Fallback to default path if no argument is provided
-    geojson_path = r"rectangle_500m.geojson"
-    print("No GeoJSON path provided as argument, using default:", geojson_path)
+def main():
+    # Get the GeoJSON path from command-line argument if provided
+    if len(sys.argv) > 1:
+        geojson_path = sys.argv[1]
+    else:
+        # Fallback to default path if no argument is provided
+        geojson_path = r"rectangle_500m.geojson"
+        print("No GeoJSON path provided as argument, using default:", geojson_path)
 
-# Step 1: Initialize OSMDataFetcher with the coordinates and radius
-osm_fetcher = OSMDataFetcherGeoJSON(geojson_path=geojson_path)
+    # Each stage hands its result to the next one in memory, intermediate files are written in the background
+    pipeline = BuildingPipeline(geojson_path=geojson_path)
 
-# Step 2: Fetch the OSM data for building, amenity, and natural features
-osm_data = osm_fetcher.fetch_osm_data()
+    # Step 1: Fetch the OSM data for building, amenity, and natural features
+    osm_data = pipeline.fetch_osm()
 
-# Step 3: Initialize MicrosoftBuildingFootprints with the AOI polygon
-msft_fetcher = MicrosoftBuildingFootprints(osm_fetcher.aoi_polygon)
+    # Step 2: Download Microsoft building footprints within the AOI
+    msft_data = pipeline.fetch_microsoft()
 
-# Step 4: Download Microsoft building footprints within the AOI
-msft_data, msft_output_path = msft_fetcher.download_microsoft_building_footprints()
+    # Step 3: Merge and deduplicate the OSM and Microsoft data
+    merged_data = pipeline.merge()
 
-# Step 5: Merge and deduplicate the OSM and Microsoft data
-data_merger = DataMerger()
-merged_data, merged_output_path = data_merger.merge_and_deduplicate_data(
-    osm_output_path=osm_fetcher.cache_dir / r"osm_building.geojson",  # Assuming this file exists
-    msft_output_path=[msft_output_path]
-)
+    # Step 4: Visualize the individual OSM features (building, amenity, and natural)
+    pipeline.visualize()
 
-# Step 6: Initialize the Visualizer and visualize the data
-visualizer = Visualizer(osm_fetcher.latitude, osm_fetcher.longitude)
+    # Wait for the background writes to finish before the converter starts its worker processes
+    pipeline.close()
 
-# You can visualize the individual OSM features and the merged data
-visualizer.visualize_data(
-    data=osm_data,  # OSM data (building, amenity, and natural)
-)
+    # Step 5: Convert the merged buildings to 3D models
+    model = pipeline.converter(extrude_height=0.0)
 
-model = GeoJSONToCADConverter(geojson_path=geojson_path, buildings_geojson_path=r"cache/merged_polygons.geojson", extrude_height=0.0)
+    # Only new or changed buildings are regenerated, building_models/manifest.json keeps their content hashes
+    # model.convert_to_step()
+    model.convert_to_stl()
 
-# model.convert_to_step()
-model.convert_to_stl()
+    # # Or write all buildings into one mesh (STL, PLY or GLB) with a building id per face
+    # model.convert_to_mesh("building_models/buildings.glb")
 
-# # Move the CAD model to the terrain
-# move_cad = MoveCADToTerrain(geojson_path=geojson_path, buildings_geojson_path=r"cache/osm_building.geojson")
-# move_cad.move_cad_to_terrain()
\ No newline at end of file
+    # # Move the CAD model to the terrain
+    # move_cad = MoveCADToTerrain(geojson_path=geojson_path, buildings_geojson_path=pipeline.osm_fetcher.output_paths["building"])
+    # move_cad.move_cad_to_terrain()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "scripts"))
+from MapDataFetcher import PrismExtruder
+
+
+def check_prism(footprint, height=10.0):
+    vertices, faces = PrismExtruder.mesh(footprint, height)
+    # Watertight: every directed edge is matched by its reverse
+    edges = Counter(map(tuple, np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]).tolist()))
+    assert all(edges.get((b, a), 0) == count for (a, b), count in edges.items())
+    # The top cap covers the footprint exactly, not the courtyards
+    top = vertices[faces[(vertices[faces][:, :, 2] == height).all(axis=1)]][:, :, :2]
+    cap_area = 0.5 * np.abs(PrismExtruder._cross(top[:, 0], top[:, 1], top[:, 2])).sum()
+    assert np.isclose(cap_area, footprint.area)
+
+
+def test_prism_with_courtyards():
+    # The third hole bridges onto a vertex an earlier bridge already uses
+    check_prism(shapely.from_wkt(
+        "POLYGON ((43 42, 43 0, 0 0, 0 42, 43 42), (32 28, 37 28, 37 32, 32 32, 32 28), "
+        "(39 26, 39 19, 42 19, 42 26, 39 26), (13 36, 8 36, 8 34, 13 34, 13 36))"
+    ))
+
+
+def test_prism_with_random_courtyards():
+    # Axis aligned courtyards on an integer grid share many bridge targets
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        width, depth = rng.integers(20, 80, 2)
+        holes = []
+        for _ in range(rng.integers(1, 6)):
+            x, y = rng.integers(1, width - 3), rng.integers(1, depth - 3)
+            w, d = rng.integers(1, 8, 2)
+            hole = shapely.box(x, y, min(x + w, width - 1), min(y + d, depth - 1))
+            if all(hole.distance(other) > 0 for other in holes):
+                holes.append(hole)
+        check_prism(shapely.Polygon(shapely.box(0, 0, width, depth).exterior.coords, [hole.exterior.coords for hole in holes]))
@@ -91,28 +91,21 @@ def convert_osm_to_geojson(osm_data):
     Returns:
         A GeoJSON object.
     """
-    # Create a lookup of nodes by ID
-    nodes = {}
-    for element in osm_data['elements']:
-        if element['type'] == 'node':
-            nodes[element['id']] = {
-                'lat': element['lat'],
-                'lon': element['lon']
-            }
+    # Create a lookup of node coordinates by ID, stored directly as [lon, lat] pairs
+    elements = osm_data['elements']
+    nodes = {
+        element['id']: [element['lon'], element['lat']]
+        for element in elements
+        if element['type'] == 'node'
+    }
     
     # Process ways (buildings)
     features = []
     
-    for element in osm_data['elements']:
+    for element in elements:
         if element['type'] == 'way' and 'tags' in element and 'building' in element['tags']:
             # Get coordinates for each node in the way
-            coords = []
-            for node_id in element['nodes']:
-                if node_id in nodes:
-                    coords.append([
-                        nodes[node_id]['lon'],
-                        nodes[node_id]['lat']
-                    ])
+            coords = [nodes[node_id] for node_id in element['nodes'] if node_id in nodes]
             
             # Ensure the polygon is closed
             if coords and coords[0] != coords[-1]: